@@ -0,0 +1,280 @@
+'''
+----------------------------------------------------------------------------------------
+Index advisor for the analysis queries
+
+Reads the query catalogue (the query of each Q_n method of queries.py) and creates,
+for each event type the queries filter on (type = '...'), one partial covering index
+on events:
+
+    CREATE INDEX idx_events_<type>_cover ON events(<join keys>)
+        INCLUDE (<other events columns of the queries>) WHERE type = '<type>'
+
+- join keys: the columns shared with a NATURAL JOIN table that is filtered in the
+  WHERE clause (match_id for matches filtered on competition_name/season_name)
+- included columns: every other events column the queries of that type use (group
+  by / join columns such as player_id, team_id and filters such as _technique)
+
+With these indexes (and a VACUUM so the visibility map is set), the events side of
+each query is an index only scan. Optionally the indexes of events that none of the
+catalogue plans uses (and that do not back a constraint or come from the advice) are
+dropped.
+
+When events is stored compact (a view over events_compact, see sb_loader.compact_events())
+the indexes are built on events_compact: the columns are mapped to their compact
+columns and, as the view filters on the label of the type and not on its type_id, the
+index is not partial but starts with type_id, so the events of a type are found
+once the type_id is looked up in event_labels. The event types with the same keys
+share one index
+
+The catalogue is read with the ast module, queries.py is not imported
+----------------------------------------------------------------------------------------
+'''
+
+import ast
+import json
+import os
+import re
+import traceback
+import sb_loader
+
+queries_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'queries.py')
+
+
+#-----------------------------------------------------------------------
+# To read the query catalogue: {Q_n: query} from the "query = ..."
+# assignment of each Q_n method
+#   file_path: the python file holding the Q_n methods
+#-----------------------------------------------------------------------
+def get_query_catalogue(file_path = queries_path):
+    with open(file_path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+
+    catalogue = {}
+    for node in tree.body:
+        if not (isinstance(node, ast.FunctionDef) and re.fullmatch(r'Q_\d+', node.name)):
+            continue
+        for n in ast.walk(node):
+            if (isinstance(n, ast.Assign) and isinstance(n.value, ast.Constant)
+                    and any(isinstance(t, ast.Name) and t.id == 'query' for t in n.targets)):
+                catalogue[node.name] = ' '.join(n.value.value.split())
+    return catalogue
+
+
+#-----------------------------------------------------------------------
+# To get the column names of a table
+#-----------------------------------------------------------------------
+def get_table_columns(conn, table_name):
+    str = 'SELECT column_name FROM information_schema.columns WHERE table_name = %s'
+    return {r[0] for r in conn.execute(str, [table_name])}
+
+
+#-----------------------------------------------------------------------
+# To work out the partial covering indexes of <table_name> for the
+# catalogue, returns {event type: (key columns, included columns, [Q_n])}
+# queries which do not read <table_name> or do not filter on a single
+# event type are skipped
+#   conn: connection to the database
+#   catalogue: {Q_n: query}, see get_query_catalogue()
+#-----------------------------------------------------------------------
+def get_index_advice(conn, catalogue, table_name = 'events'):
+    columns = get_table_columns(conn, table_name)
+    advice = {}
+
+    for (name, query) in catalogue.items():
+        if not re.search(rf'\bFROM {table_name}\b', query, re.I):
+            continue
+        types = re.findall(r"\btype\s*=\s*'([^']*)'", query)
+        if len(types) != 1:
+            print(f'      {name}: no single event type filter, skipped')
+            continue
+
+        where = re.split(r'\bWHERE\b', query, flags = re.I)[-1]
+        where = re.split(r'\b(GROUP|ORDER)\s+BY\b', where, flags = re.I)[0]
+        words = set(re.findall(r'\b[a-z_][a-z0-9_]*\b', where, re.I))
+
+        # join keys: columns shared with the NATURAL JOIN tables filtered in WHERE
+        keys = []
+        for join_table in re.findall(r'\bNATURAL\s+JOIN\s+(\w+)', query, re.I):
+            join_columns = get_table_columns(conn, join_table)
+            if words & (join_columns - columns):
+                keys += sorted(join_columns & columns)
+
+        used = (set(re.findall(r'\b[a-z_][a-z0-9_]*\b', query, re.I)) & columns) - {'type'}
+        for join_table in re.findall(r'\bNATURAL\s+JOIN\s+(\w+)', query, re.I):
+            used |= get_table_columns(conn, join_table) & columns
+
+        (k, i, q) = advice.get(types[0], ([], set(), []))
+        k += [c for c in keys if c not in k]
+        advice[types[0]] = (k, i | used, q + [name])
+
+    for (event_type, (keys, includes, names)) in advice.items():
+        if len(keys) == 0:
+            keys.append(sorted(includes)[0])
+        includes -= set(keys)
+
+    return advice
+
+
+#-----------------------------------------------------------------------
+# To get the name of the advised index of an event type (or of the keys
+# of an index shared by several types)
+#-----------------------------------------------------------------------
+def get_index_name(event_type, table_name = 'events'):
+    return f"idx_{table_name}_{re.sub(r'[^a-z0-9]+', '_', event_type.lower()).strip('_')}_cover"
+
+
+#-----------------------------------------------------------------------
+# To get the table the indexes of <table_name> are built on: the table
+# itself, or its compact table when <table_name> is the view of a table
+# stored compact (see sb_loader.compact_tables)
+#-----------------------------------------------------------------------
+def get_index_table(conn, table_name = 'events'):
+    if sb_loader.get_relkind(conn, table_name) != 'v':
+        return table_name
+    if table_name not in sb_loader.compact_tables:
+        raise ValueError(f'{table_name} is a view and not a table stored compact, no index can be built on it')
+    return sb_loader.compact_tables[table_name][0]
+
+
+#-----------------------------------------------------------------------
+# To get the advised indexes on <index_table> (see get_index_table()),
+# returns [(index name, key columns, included columns, predicate, [Q_n])]
+# On the compact table the columns are mapped to their compact columns.
+# The view filters on the label of the type, so a predicate on its type_id
+# would never be used: type_id is the first key and the event types with
+# the same keys share one index (predicate None)
+#   advice: see get_index_advice()
+#-----------------------------------------------------------------------
+def get_index_definitions(advice, table_name = 'events', index_table = 'events'):
+    if index_table == table_name:
+        return [(get_index_name(event_type, table_name), keys, sorted(includes), f"type = '{event_type}'", names)
+                for (event_type, (keys, includes, names)) in advice.items()]
+
+    views = [table_name]
+    merged = {}
+    for (event_type, (keys, includes, names)) in advice.items():
+        keys = tuple(dict.fromkeys(sb_loader.get_storage_columns(table_name, ['type'] + keys, views)[1]))
+        (i, q) = merged.get(keys, (set(), []))
+        merged[keys] = (i | set(sb_loader.get_storage_columns(table_name, sorted(includes), views)[1]), q + names)
+    return [(get_index_name('_'.join(keys), index_table), list(keys), sorted(includes - set(keys)), None, names)
+            for (keys, (includes, names)) in merged.items()]
+
+
+#-----------------------------------------------------------------------
+# To create the advised indexes and VACUUM ANALYZE the table they are
+# built on so index only scans can be used, returns the index names.
+# <conn> must be in autocommit mode (VACUUM)
+#   advice: see get_index_advice()
+#-----------------------------------------------------------------------
+def create_advised_indexes(conn, advice, table_name = 'events'):
+    index_table = get_index_table(conn, table_name)
+    index_names = []
+    for (index_name, keys, includes, predicate, names) in get_index_definitions(advice, table_name, index_table):
+        str = (f"CREATE INDEX IF NOT EXISTS {index_name} ON {index_table}({','.join(keys)})"
+               + (f" INCLUDE ({','.join(includes)})" if includes else '')
+               + (f" WHERE {predicate}" if predicate else ''))
+        print(f"----- creating {index_name} for {','.join(names)}...")
+        conn.execute(str)
+        index_names.append(index_name)
+
+    print(f'----- vacuum analyze {index_table}...')
+    conn.execute(f'VACUUM ANALYZE {index_table}')
+    return index_names
+
+
+#-----------------------------------------------------------------------
+# To get the plan of each query of the catalogue,
+# returns {Q_n: [(node type, relation, index)]} for the scan nodes
+#-----------------------------------------------------------------------
+def get_query_scans(conn, catalogue):
+    scans = {}
+    for (name, query) in catalogue.items():
+        plan = conn.execute('EXPLAIN (FORMAT JSON) ' + query).fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        nodes = [plan[0]['Plan']]
+        scans[name] = []
+        while nodes:
+            node = nodes.pop()
+            if 'Relation Name' in node:
+                scans[name].append((node['Node Type'], node['Relation Name'], node.get('Index Name')))
+            nodes += node.get('Plans', [])
+    return scans
+
+
+#-----------------------------------------------------------------------
+# To drop the advised indexes of <table_name> (named by get_index_name())
+# which none of the catalogue plans uses. The other indexes (those of
+# sb_loader.db_indexes and db_gist_indexes used by sb_zones, sb_chains and
+# sb_possessions, and the ones backing a constraint) are never dropped, an
+# index of a partition counts for the index of the partitioned table. For
+# a table stored compact the indexes of its compact table are dropped
+#   conn: connection to the database
+#   catalogue: {Q_n: query}, see get_query_catalogue()
+#   keep: names of indexes kept even if unused (the advised indexes, the
+#         planner may prefer a seq scan while the tables are small)
+#-----------------------------------------------------------------------
+def drop_unused_indexes(conn, catalogue, table_name = 'events', keep = ()):
+    used = set(keep)
+    for (name, scans) in get_query_scans(conn, catalogue).items():
+        for (node_type, relation, index_name) in scans:
+            if index_name is not None:
+                str = 'SELECT relid::regclass::text FROM pg_partition_ancestors(%s::regclass)'
+                used |= {r[0] for r in conn.execute(str, [index_name])}
+
+    index_table = get_index_table(conn, table_name)
+    str = '''
+        SELECT i.indexrelid::regclass::text
+        FROM pg_index i
+        WHERE i.indrelid = %s::regclass
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conindid = i.indexrelid)
+        ORDER BY 1
+    '''
+    for (index_name,) in conn.execute(str, [index_table]).fetchall():
+        if not (index_name.startswith(f'idx_{index_table}_') and index_name.endswith('_cover')): continue
+        if index_name not in used:
+            print(f'----- dropping unused index {index_name}...')
+            conn.execute(f'DROP INDEX {index_name}')
+
+
+#-----------------------------------------------------------------------
+# To print the scans of the events table in each catalogue plan
+#-----------------------------------------------------------------------
+def print_query_scans(conn, catalogue, table_name = 'events'):
+    for (name, scans) in get_query_scans(conn, catalogue).items():
+        for (node_type, relation, index_name) in scans:
+            if relation == table_name or relation.startswith(table_name + '_'):
+                print(f'      {name}: {node_type} on {relation}' + (f' using {index_name}' if index_name else ''))
+
+
+#-------------------------------------------
+# main
+#   drop_unused = drop the advised events indexes the catalogue does not use
+#-------------------------------------------
+def main(drop_unused = False):
+    conn = None
+    try:
+        conn = sb_loader.connect(autocommit=True)
+
+        catalogue = get_query_catalogue()
+        print(f'----- {len(catalogue)} queries read from {queries_path}')
+
+        advice = get_index_advice(conn, catalogue)
+        index_names = create_advised_indexes(conn, advice)
+
+        if drop_unused:
+            drop_unused_indexes(conn, catalogue, keep = index_names)
+
+        print('----- plans of the catalogue:')
+        print_query_scans(conn, catalogue)
+
+    except Exception as e:
+        print(traceback.format_exc())
+
+    finally:
+        if conn is not None:
+            conn.close()
+#-----------------------------------------------------
+
+if __name__ == '__main__':
+    main()
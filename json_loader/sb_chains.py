@@ -0,0 +1,113 @@
+'''
+----------------------------------------------------------------------------------------
+Possession chains of events
+
+The events of a possession are linked two ways:
+
+    event_related   adjacency list of the related events, both directions
+                    (pass <-> ball receipt <-> carry <-> next pass...), primary key
+                    (event_id, related_event) and index (related_event, event_id)
+    _key_pass_id    the pass leading to a shot (events primary key)
+
+The chain of an event is found with a recursive query walking these links back to
+the earlier events of the same possession, each step is an index lookup on the
+event_related primary key and the events primary key:
+
+    for (depth, event_id, index, type, player_id) in get_event_chain(conn, shot_id):
+        ...
+
+get_shot_chains() returns the chain of every shot of a match at once
+----------------------------------------------------------------------------------------
+'''
+
+import traceback
+import sb_loader
+
+
+# -------------------------------------------------------------------------
+# recursive query of the chains ending with the events of <start>, a query
+# returning event_id. Returns (start event, depth, event_id, index, type,
+# player_id), the events linked to a chain event (event_related or
+# _key_pass_id) before it in the same possession belong to the chain
+# -------------------------------------------------------------------------
+chain_query = '''
+    WITH RECURSIVE chain (start_id, event_id, match_id, possession, index, depth, path) AS (
+        SELECT events.event_id, events.event_id, events.match_id, events.possession, events.index, 0, ARRAY[events.event_id]
+        FROM events
+        WHERE events.event_id IN ({start})
+      UNION ALL
+        SELECT chain.start_id, events.event_id, chain.match_id, chain.possession, events.index, chain.depth + 1,
+               chain.path || events.event_id
+        FROM chain
+            JOIN LATERAL (
+                SELECT event_related.related_event FROM event_related WHERE event_related.event_id = chain.event_id
+              UNION
+                SELECT e._key_pass_id FROM events e WHERE e.event_id = chain.event_id AND e._key_pass_id IS NOT NULL
+            ) link(event_id) ON true
+            JOIN events ON events.event_id = link.event_id
+        WHERE events.match_id = chain.match_id
+          AND events.possession = chain.possession
+          AND events.index < chain.index
+          AND events.event_id <> ALL (chain.path)
+          AND chain.depth < %(max_depth)s
+    )
+    SELECT DISTINCT ON (chain.start_id, chain.event_id)
+           chain.start_id, chain.depth, chain.event_id, events.index, events.type, events.player_id
+    FROM chain
+        JOIN events ON events.event_id = chain.event_id
+    ORDER BY chain.start_id, chain.event_id, chain.depth
+'''
+
+
+#-----------------------------------------------------------------------
+# To get the chain of an event, returns [(depth, event_id, index, type,
+# player_id)] in the order of the events, the event itself has depth 0
+#   conn: connection to the database
+#   max_depth: number of links followed at most
+#-----------------------------------------------------------------------
+def get_event_chain(conn, event_id, max_depth = 50):
+    str = chain_query.format(start = '%(event_id)s')
+    rows = conn.execute(str, {'event_id': event_id, 'max_depth': max_depth}).fetchall()
+    return sorted([r[1:] for r in rows], key = lambda r: r[2])
+
+
+#-----------------------------------------------------------------------
+# To get the chains of the shots of a match, returns
+# {shot event_id: [(depth, event_id, index, type, player_id)]}
+#-----------------------------------------------------------------------
+def get_shot_chains(conn, match_id, max_depth = 50):
+    str = chain_query.format(start = "SELECT event_id FROM events WHERE match_id = %(match_id)s AND type = 'Shot'")
+    chains = {}
+    for r in conn.execute(str, {'match_id': match_id, 'max_depth': max_depth}):
+        chains.setdefault(r[0], []).append(r[1:])
+    return {k: sorted(v, key = lambda r: r[2]) for (k, v) in chains.items()}
+
+
+#-------------------------------------------
+# main
+#-------------------------------------------
+def main():
+    conn = None
+    try:
+        conn = sb_loader.connect()
+
+        str = "SELECT event_id FROM events WHERE type = 'Shot' ORDER BY _statsbomb_xg DESC NULLS LAST LIMIT 1"
+        row = conn.execute(str).fetchone()
+        if row is None:
+            print('----- no shot in events')
+            return
+
+        print(f'----- chain of the shot {row[0]} with the highest xG:')
+        for (depth, event_id, index, type, player_id) in get_event_chain(conn, row[0]):
+            print(f'      {index:>5} {type:<16} player {player_id} (depth {depth})')
+
+    except Exception as e:
+        print(traceback.format_exc())
+
+    finally:
+        if conn is not None:
+            conn.close()
+#-----------------------------------------------------
+
+if __name__ == '__main__':
+    main()
@@ -8,7 +8,14 @@ This code used to combine statsbomb json files and create 3 following files
 3. sb_events.json  : contains event data for matches under La Liga season 2018/2019, 
                      2019/2020 and 2020/2021 and Premier League season 2003/2004
 
-These files will be placed in folder statsbomb
+With file_format='jsonl' or 'parquet' (needs pyarrow) the files are written as
+sb_<name>.jsonl or sb_<name>.parquet instead; sb_loader reads all three.
+
+The competitions and seasons come from default_selection or from sb_selection.json
+if that file exists.
+
+These files will be placed in folder statsbomb, each with a manifest
+(sb_<name>_manifest.json) so later runs only parse new or changed match files
 
 The stabsbomb folder with all its file and subfolders (competitions.json, events, 
 lineups, matches...) downloaded from GitHub should be placed under folder json_loader 
@@ -18,86 +25,789 @@ together with the script (sb_combine_json.py and sb_parse_data.py)
 
 import os
 import json
+import hashlib
+import heapq
 from datetime import datetime
+from collections import deque
+from multiprocessing import Pool
+
+# pyarrow is only needed for the parquet output
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
 
 
 # -------------------------------------------------------------------------
-# to build a list with (file name, file path) under the selected direcory 
+# to iterate over (file name, file path) under the selected direcory 
 # and its sub directories
+#   dir_list:  directories (e.g. 'statsbomb/matches/11') to look into, the
+#              folders above them are walked through and everything below
+#              them is included. None -> all directories
+#   file_list: file names to keep. None -> all files
+#   max_depth: how many levels of sub directories to go down. None -> all
+# files are yielded lazily while the directories are scanned
 # -------------------------------------------------------------------------
-def get_files(file_path, dir_list = None, file_list = None):
+def get_files(file_path, dir_list = None, file_list = None, max_depth = None):
     # file_path must end with '/'
     if file_path[-1] != '/': file_path = file_path + '/'
 
-    # get files under file_path
-    files = [(f,file_path) for f in os.listdir(file_path) if os.path.isfile(file_path+f)]
-    if file_list is not None: files = [(f,p) for (f,p) in files if f in file_list]
+    if file_list is not None: file_list = set(file_list)
 
-    # get subdirectories under file_path
-    dirs = [d for d in os.listdir(file_path) if os.path.isdir(file_path+d)]
-    if dir_list is not None: dirs = [d for d in dirs if (file_path+d) in dir_list]
+    # directories to enter: the listed ones plus all their parent folders
+    parents = set()
+    if dir_list is not None:
+        dir_list = set(d.rstrip('/') for d in dir_list)
+        for d in dir_list:
+            while '/' in d:
+                d = d.rsplit('/', 1)[0]
+                parents.add(d)
+
+    yield from scan_files(file_path, dir_list, parents, file_list, max_depth)
 
-    # get files in subdirectories    
-    for d in dirs:
-        fs = [(f,file_path + d +'/') for f in os.listdir(file_path + d) if os.path.isfile(file_path+d+'/'+f)]
-        if file_list is not None: fs = [(f,p) for (f,p) in fs if f in file_list] 
-        files = files + fs
 
-    return files
+# -------------------------------------------------------------------------
+# helper for get_files(), one os.scandir() call per directory
+# -------------------------------------------------------------------------
+def scan_files(file_path, dir_list, parents, file_list, max_depth):
+    dirs = []
+
+    with os.scandir(file_path) as it:
+        for entry in it:
+            if entry.is_file():
+                if file_list is None or entry.name in file_list:
+                    yield (entry.name, file_path)
+            elif entry.is_dir():
+                dirs.append(entry.name)
+
+    if max_depth is not None:
+        if max_depth <= 0: return
+        max_depth = max_depth - 1
+
+    for d in dirs:
+        sub_dir_list = dir_list
+        if dir_list is not None:
+            if (file_path + d) in dir_list: sub_dir_list = None
+            elif (file_path + d) not in parents: continue
 
+        yield from scan_files(file_path + d + '/', sub_dir_list, parents, file_list, max_depth)
 
 
 # -------------------------------------------------------------------------
 # to combine json files listed in the list 'files' into a single data file
 # indicated by <combined_file_path>
+#   stream:      when True, each match file is read, tagged and written out
+#                before the next one is opened, so memory stays at roughly
+#                one match file. When False, all records are collected first
+#                and dumped with indent=2 (original behaviour)
+#   file_format: 'json'    -> a json array, one record per line
+#                'jsonl'   -> json lines, one record per line without brackets
+#                'parquet' -> zstd compressed parquet, one row group per match
+#                             file, columns as described by 'columns'
+#   columns:     parquet column spec, see event_columns. None -> only
+#                file_name plus the whole record as a json column
+#   workers:     number of processes used to parse the match files. Files
+#                are always combined in sorted order so the output is the
+#                same whatever the number of workers
+#   incremental: a manifest (see get_manifest_path()) records the size,
+#                mtime and sha256 of every source file, it is written by
+#                every build. When True, only new or changed files are
+#                parsed; records of unchanged files are copied from the
+#                existing combined file and merged with the new ones in the
+#                same sorted order as a full rebuild
 # -------------------------------------------------------------------------
-def combine_files(combined_file_path, files):
-    df = []
+def combine_files(combined_file_path, files, stream = True, file_format = 'json', workers = 1, incremental = False,
+                  columns = None):
+    if file_format not in ('json','jsonl','parquet'):
+        raise ValueError(f'unsupported file format: {file_format}')
+    if file_format == 'parquet' and pa is None:
+        raise ImportError('pyarrow is required for the parquet file format')
 
-    for i in range(len(files)):
-        print('processing', files[i][0],'...')
+    files = sorted(files, key = lambda f: (f[1], f[0]))
+    previous_batches = []
+
+    if incremental:
+        previous = load_manifest(combined_file_path, file_format)
+        manifest = build_manifest(files, previous)
+        (changed_files, drop_names) = get_changed_files(files, manifest, previous)
+
+        if previous is not None and len(changed_files) == 0 and len(drop_names) == 0:
+            print(combined_file_path,'is up to date')
+            save_manifest(combined_file_path, file_format, manifest)
+            return
+        print(f'      {len(changed_files)} files to parse')
+
+        if previous is not None:
+            # existing records are streamed through one match file at a time,
+            # as raw lines when the file holds one record per line
+            kept_files = [(f,p) for (f,p) in files if f not in drop_names]
+            raw = stream and file_format != 'parquet' and is_splittable(combined_file_path, file_format)
+            previous_batches = read_previous_batches(combined_file_path, file_format, drop_names, kept_files, raw)
+        files = changed_files
+
+    # (sort key, records) of the parsed files merged with the previous ones
+    def merge(parsed):
+        keyed = zip(((p,f) for (f,p) in files), parsed)
+        return (data for (key, data) in heapq.merge(previous_batches, keyed, key = lambda b: b[0]))
+
+    if workers is not None and workers > 1:
+        with Pool(workers) as pool:
+            # the workers parse at most 2 files each ahead of the writer
+            batches = merge(map_ahead(pool, read_file, files, 2 * workers))
+            combine_batches(combined_file_path, batches, stream, file_format, columns)
+    else:
+        combine_batches(combined_file_path, merge(map(read_file, files)), stream, file_format, columns)
+
+    # a full rebuild writes the manifest too, so the next incremental run
+    # does not trust the manifest of an older combined file
+    if not incremental:
+        manifest = build_manifest(files)
+    save_manifest(combined_file_path, file_format, manifest)
+
+
+# -------------------------------------------------------------------------
+# to read back the records of an existing combined file as one batch per
+# match file (records with the same file_name following each other), so
+# they are written again one match file (parquet row group) at a time
+# yields (sort key, records), the sort key (path, name) of a batch is the
+# one of the next file of <kept_files> with that name, as the combined
+# file holds the match files in sorted order
+#   drop_names: file names whose records are left out
+#   kept_files: the (file name, file path) sorted list of the files whose
+#               records are kept
+#   raw:        the json / json lines file holds one record per line (see
+#               write_records()), the records are yielded as their json
+#               text without being decoded and are written back as they are
+# -------------------------------------------------------------------------
+def read_previous_batches(combined_file_path, file_format, drop_names, kept_files, raw = False):
+    keys = {}
+    for (f,p) in kept_files:
+        keys.setdefault(f, deque()).append((p,f))
 
-        with open(files[i][1]+files[i][0], mode = 'r',encoding = 'utf-8') as f:
-            data = json.load(f)
-            for d in data:
-                d['file_name'] = files[i][0]
-        df = df + data
+    if raw:
+        records = read_raw_lines(combined_file_path)
+        get_name = get_line_file_name
+    else:
+        records = read_combined_file(combined_file_path, file_format)
+        get_name = lambda d: d.get('file_name')
 
+    def batch(data, name):
+        return (keys[name].popleft() if keys.get(name) else ('', name), data)
+
+    data = []
+    name = None
+    for d in records:
+        d_name = get_name(d)
+        if d_name in drop_names: continue
+        if len(data) > 0 and d_name != name:
+            yield batch(data, name)
+            data = []
+        data.append(d)
+        name = d_name
+    if len(data) > 0:
+        yield batch(data, name)
+
+
+# -------------------------------------------------------------------------
+# to read the records of a combined file holding one record per line (see
+# write_records()) as their json text, without decoding them
+# -------------------------------------------------------------------------
+def read_raw_lines(combined_file_path):
+    with open(combined_file_path, mode = 'r', encoding = 'utf-8') as f:
+        for line in f:
+            line = line.strip().rstrip(',')
+            if line in ('', '[', ']'): continue
+            yield line
+
+
+# -------------------------------------------------------------------------
+# to get the file name of a record from its json text, read_file() adds
+# file_name as the last key of every record
+# -------------------------------------------------------------------------
+def get_line_file_name(line):
+    key = '"file_name": "'
+    i = line.rfind(key)
+    if i < 0: return None
+    i += len(key)
+    return line[i:line.index('"', i)]
+
+
+# -------------------------------------------------------------------------
+# to map <func> over <items> with the process pool <pool>, yielding the
+# results in the order of <items>. At most <window> items are submitted
+# and not yet yielded, so the parsed files do not pile up in memory when
+# the workers are faster than the consumer (Pool.imap has no such limit)
+# -------------------------------------------------------------------------
+def map_ahead(pool, func, items, window):
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+
+# -------------------------------------------------------------------------
+# to write parsed batches of records (one list per match file) to
+# <combined_file_path>, see combine_files() for the parameters
+# the data is written to a temporary file first so an existing combined
+# file can still be read while the new one is being built
+# -------------------------------------------------------------------------
+def combine_batches(combined_file_path, batches, stream = True, file_format = 'json', columns = None):
+    tmp_file_path = combined_file_path + '.tmp'
     print('writing to',combined_file_path,'...')
 
-    with open(combined_file_path, mode='w', encoding='utf-8') as f:
-        json.dump(df,f,indent=2)
+    if file_format == 'parquet':
+        # parquet is always written one row group (match file) at a time
+        write_parquet(tmp_file_path, batches, columns)
+    elif not stream:
+        df = []
+        for data in batches:
+            df.extend(data)
+
+        with open(tmp_file_path, mode='w', encoding='utf-8') as f:
+            if file_format == 'jsonl':
+                for d in df:
+                    f.write(json.dumps(d) + '\n')
+            else:
+                json.dump(df,f,indent=2)
+    else:
+        with open(tmp_file_path, mode='w', encoding='utf-8') as f:
+            write_records(f, batches, file_format)
 
+    os.replace(tmp_file_path, combined_file_path)
     print('...file saved')
 
+
+# -------------------------------------------------------------------------
+# to load a single json file and tag each record with the file name
+#   file: (file name, file path) as returned by get_files()
+# -------------------------------------------------------------------------
+def read_file(file):
+    (file_name, file_path) = file
+    print('processing', file_name,'...')
+    with open(file_path + file_name, mode = 'r',encoding = 'utf-8') as f:
+        data = json.load(f)
+    for d in data:
+        d['file_name'] = file_name
+    return data
+
+
+# -------------------------------------------------------------------------
+# to write batches of records to the opened file <f> one record at a time
+#   batches:     iterable of record lists (one list per match file), a
+#                record given as a str is json text written as it is
+#   file_format: 'json' or 'jsonl', see combine_files()
+# -------------------------------------------------------------------------
+def write_records(f, batches, file_format = 'json'):
+    first = True
+    if file_format == 'json': f.write('[\n')
+
+    for data in batches:
+        for d in data:
+            if file_format == 'json' and not first: f.write(',\n')
+            f.write(d if type(d) is str else json.dumps(d))
+            if file_format == 'jsonl': f.write('\n')
+            first = False
+
+    if file_format == 'json': f.write('\n]\n')
+
+
+# -------------------------------------------------------------------------
+# to read back the records of a combined file one at a time
+# json arrays are decoded incrementally (see read_json_array()) whatever
+# their layout, so only a chunk of the file is kept in memory
+#   chunk_size: number of characters read from the file at a time
+#   part:       (k, n) to read only the k-th of n shares of the file, see
+#               is_splittable(). None -> the whole file
+#   file_names: only the records of these match files (file_name), the
+#               other ones are skipped before being decoded when the file
+#               holds one record per line (by row group for parquet).
+#               None -> all records
+# -------------------------------------------------------------------------
+def read_combined_file(combined_file_path, file_format = 'json', chunk_size = 1 << 20, part = None,
+                       file_names = None):
+    if file_format == 'parquet':
+        yield from read_parquet(combined_file_path, part, file_names)
+        return
+
+    if part is not None or (file_names is not None and is_splittable(combined_file_path, file_format)):
+        yield from read_lines_part(combined_file_path, part or (0, 1), file_names)
+        return
+
+    with open(combined_file_path, mode = 'r', encoding = 'utf-8') as f:
+        if file_format == 'jsonl':
+            for line in f:
+                if line.strip() != '': yield json.loads(line)
+        else:
+            records = read_json_array(f, chunk_size)
+            if file_names is not None:
+                records = (d for d in records if d.get('file_name') in file_names)
+            yield from records
+
+
+# -------------------------------------------------------------------------
+# to check if a combined file can be read in shares by several processes
+# parquet files are split by row group (match file); json lines files and
+# json arrays written one record per line by write_records() are split in
+# byte ranges on line boundaries
+# -------------------------------------------------------------------------
+def is_splittable(combined_file_path, file_format = 'json'):
+    if file_format in ('parquet', 'jsonl'):
+        return True
+
+    with open(combined_file_path, mode = 'r', encoding = 'utf-8') as f:
+        if f.readline().strip() != '[':
+            return False
+        line = f.readline().strip().rstrip(',')
+    if line in ('', ']'):
+        return True
+    try:
+        json.loads(line)
+    except json.JSONDecodeError:
+        return False
+    return True
+
+
+# -------------------------------------------------------------------------
+# to read the records of the k-th of n byte ranges of a file holding one
+# record per line. A line belongs to the range in which it starts
+#   file_names: see read_combined_file(), matched on the line text
+# -------------------------------------------------------------------------
+def read_lines_part(combined_file_path, part, file_names = None):
+    (k, n) = part
+    size = os.path.getsize(combined_file_path)
+    start = size * k // n
+    end = size * (k + 1) // n
+
+    with open(combined_file_path, mode = 'rb') as f:
+        if start > 0:
+            # skip the line started in the previous range
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line: break
+            line = line.strip().rstrip(b',')
+            if line in (b'', b'[', b']'): continue
+            if file_names is not None and get_line_file_name(line.decode('utf-8')) not in file_names: continue
+            yield json.loads(line)
+
+
+# -------------------------------------------------------------------------
+# to decode the elements of a json array from the opened file <f> one at
+# a time, reading <chunk_size> characters at a time
+# an element is only taken once it is followed by a separator, so a number
+# or an object cut at the end of a chunk is never decoded half way
+# the elements must be separated by exactly one ',' and only white space
+# may follow the closing ']', a malformed array raises a ValueError instead
+# of loading part of the data
+# -------------------------------------------------------------------------
+def read_json_array(f, chunk_size = 1 << 20):
+    decoder = json.JSONDecoder()
+    buf = ''
+    pos = 0
+    eof = False
+
+    def skip(chars):
+        nonlocal buf, pos, eof
+        while True:
+            while pos < len(buf) and buf[pos] in chars: pos += 1
+            if pos < len(buf) or eof: return
+            buf = f.read(chunk_size)
+            pos = 0
+            eof = len(buf) == 0
+
+    # after the closing ']' at <pos>
+    def check_end():
+        nonlocal pos
+        pos += 1
+        skip(' \t\r\n')
+        if pos < len(buf):
+            raise ValueError(f'{getattr(f, "name", "file")}: unexpected data after the json array')
+
+    skip(' \t\r\n')
+    if pos == len(buf) or buf[pos] != '[':
+        raise ValueError(f'{getattr(f, "name", "file")} does not hold a json array')
+    pos += 1
+    skip(' \t\r\n')
+    if pos < len(buf) and buf[pos] == ']':
+        check_end()
+        return
+
+    while True:
+        skip(' \t\r\n')
+        if pos == len(buf):
+            raise ValueError(f'{getattr(f, "name", "file")}: unexpected end of json array')
+
+        try:
+            (d, end) = decoder.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            end = None
+        if end is None or end == len(buf) or buf[end] not in ' \t\r\n,]':
+            if eof:
+                if end is None or end < len(buf):
+                    raise ValueError(f'{getattr(f, "name", "file")}: invalid json')
+            else:
+                # element not complete yet, read more (at least as much as we have)
+                more = f.read(max(chunk_size, len(buf) - pos))
+                eof = len(more) == 0
+                buf = buf[pos:] + more
+                pos = 0
+                continue
+
+        yield d
+        pos = end
+
+        skip(' \t\r\n')
+        if pos == len(buf):
+            raise ValueError(f'{getattr(f, "name", "file")}: unexpected end of json array')
+        if buf[pos] == ']':
+            check_end()
+            return
+        if buf[pos] != ',':
+            raise ValueError(f'{getattr(f, "name", "file")}: expected , or ] after an array element')
+        pos += 1
+
+
+# -------------------------------------------------------------------------
+# parquet column spec for events: (json key, kind)
+#   string, int, float, bool: scalar column with the same name
+#   ref:   {"id", "name"} object flattened to <key>_id and <key>_name
+#   point: location list stored as list<double>
+#   json:  nested object kept as a binary column with its json text
+# a value that does not fit its column (other type, extra keys...) is kept
+# in the binary column _extra together with all keys not listed here, so
+# records read back from parquet are the same as the json ones
+# -------------------------------------------------------------------------
+event_columns = [
+    ('id','string'), ('index','int'), ('period','int'), ('timestamp','string'),
+    ('minute','int'), ('second','int'), ('type','ref'), ('possession','int'),
+    ('possession_team','ref'), ('play_pattern','ref'), ('team','ref'), ('player','ref'),
+    ('position','ref'), ('location','point'), ('duration','float'), ('under_pressure','bool'),
+    ('off_camera','bool'), ('out','bool'), ('counterpress','bool'), ('file_name','string'),
+    ('related_events','json'), ('tactics','json'),
+    ('50_50','json'), ('bad_behaviour','json'), ('ball_receipt','json'), ('ball_recovery','json'),
+    ('block','json'), ('carry','json'), ('clearance','json'), ('dribble','json'),
+    ('dribbled_past','json'), ('duel','json'), ('foul_committed','json'), ('foul_won','json'),
+    ('goalkeeper','json'), ('half_end','json'), ('half_start','json'), ('injury_stoppage','json'),
+    ('interception','json'), ('miscontrol','json'), ('pass','json'), ('player_off','json'),
+    ('pressure','json'), ('shot','json'), ('substitution','json'),
+]
+
+default_columns = [('file_name','string')]
+
+
+def get_parquet_schema(columns):
+    types = {'string': pa.string(), 'int': pa.int64(), 'float': pa.float64(), 'bool': pa.bool_(),
+             'point': pa.list_(pa.float64()), 'json': pa.binary()}
+    fields = []
+    for (key, kind) in columns:
+        if kind == 'ref':
+            fields.append(pa.field(key + '_id', pa.int64()))
+            fields.append(pa.field(key + '_name', pa.string()))
+        else:
+            fields.append(pa.field(key, types[kind]))
+    fields.append(pa.field('_extra', pa.binary()))
+
+    return pa.schema(fields, metadata = {'sb_columns': json.dumps(columns)})
+
+
+# -------------------------------------------------------------------------
+# to split a record into its parquet column values, see event_columns
+# -------------------------------------------------------------------------
+def to_parquet_row(d, columns):
+    row = {}
+    extra = dict(d)
+
+    for (key, kind) in columns:
+        v = d.get(key)
+        if kind == 'ref':
+            row[key + '_id'] = row[key + '_name'] = None
+        else:
+            row[key] = None
+        if v is None: continue
+
+        if kind == 'string': ok = type(v) is str
+        elif kind == 'int': ok = type(v) is int
+        elif kind == 'float': ok = type(v) is float
+        elif kind == 'bool': ok = type(v) is bool
+        elif kind == 'point': ok = type(v) is list and all(type(x) is float for x in v)
+        elif kind == 'ref': ok = type(v) is dict and v.keys() == {'id','name'} and type(v['id']) is int and type(v['name']) is str
+        else: ok = True
+        if not ok: continue
+
+        if kind == 'ref':
+            row[key + '_id'] = v['id']
+            row[key + '_name'] = v['name']
+        elif kind == 'json':
+            row[key] = json.dumps(v).encode('utf-8')
+        else:
+            row[key] = v
+        del extra[key]
+
+    row['_extra'] = json.dumps(extra).encode('utf-8') if extra else None
+    return row
+
+
+def from_parquet_row(row, columns):
+    d = json.loads(row['_extra']) if row['_extra'] is not None else {}
+
+    for (key, kind) in columns:
+        if kind == 'ref':
+            if row[key + '_id'] is not None:
+                d[key] = {'id': row[key + '_id'], 'name': row[key + '_name']}
+        elif row[key] is not None:
+            d[key] = json.loads(row[key]) if kind == 'json' else row[key]
+
+    return d
+
+
+# -------------------------------------------------------------------------
+# to write batches of records to a parquet file, one row group per batch
+# -------------------------------------------------------------------------
+def write_parquet(parquet_file_path, batches, columns = None):
+    if columns is None: columns = default_columns
+    schema = get_parquet_schema(columns)
+
+    with pq.ParquetWriter(parquet_file_path, schema, compression = 'zstd') as writer:
+        for data in batches:
+            rows = [to_parquet_row(d, columns) for d in data]
+            if len(rows) > 0:
+                writer.write_table(pa.Table.from_pylist(rows, schema = schema))
+
+
+# -------------------------------------------------------------------------
+# to read back the records of a parquet file one row group at a time
+#   part: (k, n) to read only every n-th row group starting at k
+#   file_names: see read_combined_file(), row groups of other match files
+#               are skipped after reading their file_name column only
+# -------------------------------------------------------------------------
+def read_parquet(parquet_file_path, part = None, file_names = None):
+    if pa is None:
+        raise ImportError('pyarrow is required for the parquet file format')
+
+    f = pq.ParquetFile(parquet_file_path)
+    columns = json.loads(f.schema_arrow.metadata[b'sb_columns'])
+
+    for i in range(f.num_row_groups):
+        if part is not None and i % part[1] != part[0]: continue
+        if file_names is not None:
+            # a row group holds a single match file, see write_parquet()
+            names = f.read_row_group(i, columns = ['file_name']).column('file_name')
+            if len(names) == 0 or names[0].as_py() not in file_names: continue
+        for row in f.read_row_group(i).to_pylist():
+            yield from_parquet_row(row, columns)
+
+
+# -------------------------------------------------------------------------
+# manifest of the source files used to build <combined_file_path>
+#   {"file_format": ..., "combined": {"size", "mtime"},
+#    "files": {<path>: {"size", "mtime", "sha256"}}}
+# combined holds the size and mtime of the combined file the manifest was
+# written with
+# -------------------------------------------------------------------------
+def get_manifest_path(combined_file_path):
+    return os.path.splitext(combined_file_path)[0] + '_manifest.json'
+
+
+# -------------------------------------------------------------------------
+# to load the manifest of <combined_file_path>
+# returns None when there is no usable previous build (no manifest, no
+# combined file, a different file format or a combined file written after
+# the manifest), i.e. a full rebuild is needed
+# -------------------------------------------------------------------------
+def load_manifest(combined_file_path, file_format):
+    manifest_path = get_manifest_path(combined_file_path)
+    if not (os.path.isfile(manifest_path) and os.path.isfile(combined_file_path)):
+        return None
+
+    with open(manifest_path, mode = 'r', encoding = 'utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('file_format') != file_format:
+        return None
+    if manifest.get('combined') != get_file_stat(combined_file_path):
+        return None
+
+    return manifest['files']
+
+
+def save_manifest(combined_file_path, file_format, manifest):
+    with open(get_manifest_path(combined_file_path), mode = 'w', encoding = 'utf-8') as f:
+        json.dump({'file_format': file_format, 'combined': get_file_stat(combined_file_path), 'files': manifest},
+                  f, indent = 2)
+
+
+def get_file_stat(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': st.st_mtime_ns}
+
+
+# -------------------------------------------------------------------------
+# to build the manifest entries for the (file name, file path) list 'files'
+# the content hash is only computed again when size or mtime has changed
+# -------------------------------------------------------------------------
+def build_manifest(files, previous = None):
+    manifest = {}
+
+    for (file_name, file_path) in files:
+        path = file_path + file_name
+        entry = get_file_stat(path)
+
+        old = previous.get(path) if previous is not None else None
+        if old is not None and old['size'] == entry['size'] and old['mtime'] == entry['mtime']:
+            entry['sha256'] = old['sha256']
+        else:
+            entry['sha256'] = get_file_hash(path)
+        manifest[path] = entry
+
+    return manifest
+
+
+def get_file_hash(path):
+    h = hashlib.sha256()
+    with open(path, mode = 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# -------------------------------------------------------------------------
+# to compare the current manifest with the previous one
+# returns (files to parse, file names whose records must be dropped from
+# the existing combined file)
+# records only carry the file name, not its folder (e.g. matches/11/4.json
+# and matches/16/4.json), so every selected file sharing a name with a new,
+# changed or removed file is parsed again
+# -------------------------------------------------------------------------
+def get_changed_files(files, manifest, previous):
+    if previous is None:
+        return (files, set())
+
+    drop_names = set()
+    for (path, entry) in manifest.items():
+        old = previous.get(path)
+        if old is None or old['sha256'] != entry['sha256']:
+            drop_names.add(os.path.basename(path))
+    for path in previous:
+        if path not in manifest:
+            drop_names.add(os.path.basename(path))
+
+    return ([(f,p) for (f,p) in files if f in drop_names], drop_names)
+
+# -------------------------------------------------------------------------
+# matches to combine, one entry per competition
+#   competition: competition id or name (as in competitions.json)
+#   seasons:     season ids or names, omitted -> all seasons
+#   date_from, date_to: optional 'YYYY-MM-DD' limits on match_date
+# the selection can also be given in sb_selection.json (same layout) so
+# other leagues can be added without changing the code
+# -------------------------------------------------------------------------
+default_selection = [
+    {'competition': 'La Liga', 'seasons': ['2018/2019','2019/2020','2020/2021']},
+    {'competition': 'Premier League', 'seasons': ['2003/2004']},
+]
+
+
+# -------------------------------------------------------------------------
+# to load the selection from a json file, or the default one if the file
+# does not exist
+# -------------------------------------------------------------------------
+def load_selection(selection_path = 'sb_selection.json'):
+    if not os.path.isfile(selection_path):
+        return default_selection
+
+    with open(selection_path, mode = 'r', encoding = 'utf-8') as f:
+        return json.load(f)
+
+
+# -------------------------------------------------------------------------
+# to resolve the selection against competitions.json
+# returns a list of (competition_id, season_id, date_from, date_to)
+# a competition or season of the selection not found in competitions.json
+# raises a ValueError
+# -------------------------------------------------------------------------
+def resolve_selection(selection, competitions_path = 'statsbomb/competitions.json'):
+    with open(competitions_path, mode = 'r', encoding = 'utf-8') as f:
+        competitions = json.load(f)
+
+    resolved = []
+    for spec in selection:
+        competition = spec['competition']
+        seasons = spec.get('seasons')
+        if seasons is not None: seasons = set(seasons)
+
+        found = False
+        found_seasons = set()
+        for c in competitions:
+            if competition not in (c['competition_id'], c['competition_name']): continue
+            found = True
+            if seasons is not None and c['season_id'] not in seasons and c['season_name'] not in seasons: continue
+            found_seasons.update((c['season_id'], c['season_name']))
+            resolved.append((c['competition_id'], c['season_id'], spec.get('date_from'), spec.get('date_to')))
+
+        if not found:
+            raise ValueError(f'competition not found in {competitions_path}: {competition}')
+        if seasons is not None and not seasons <= found_seasons:
+            missing = ', '.join(str(season) for season in seasons - found_seasons)
+            raise ValueError(f'seasons of {competition} not found in {competitions_path}: {missing}')
+
+    return resolved
+
+
+# -------------------------------------------------------------------------
+# to build the match id index of the resolved selection from the
+# per competition/season match files (statsbomb/matches/<competition>/<season>.json)
+# returns {match_id: (competition_id, season_id)}
+# -------------------------------------------------------------------------
+def get_match_index(resolved, matches_path = 'statsbomb/matches/'):
+    if matches_path[-1] != '/': matches_path = matches_path + '/'
+
+    index = {}
+    for (competition_id, season_id, date_from, date_to) in resolved:
+        with open(f'{matches_path}{competition_id}/{season_id}.json', mode = 'r', encoding = 'utf-8') as f:
+            matches = json.load(f)
+
+        for m in matches:
+            if date_from is not None and m['match_date'] < date_from: continue
+            if date_to is not None and m['match_date'] > date_to: continue
+            index[m['match_id']] = (competition_id, season_id)
+
+    return index
+
+
 #---------------------------------------------
 # main program
 #---------------------------------------------  
-def main():
-    # get files for La Liga (folder '11') and Premier League (folder '2') 
-    competition_list=['statsbomb/matches/11','statsbomb/matches/2']
+def main(workers = os.cpu_count(), incremental = True, selection = None, file_format = 'json'):
+    ext = {'json': '.json', 'jsonl': '.jsonl', 'parquet': '.parquet'}[file_format]
+
+    if selection is None: selection = load_selection()
+    resolved = resolve_selection(selection)
+
+    # get all match files of the selected competitions
+    competition_list = {f'statsbomb/matches/{c}' for (c, s, df, dt) in resolved}
 
     fs = get_files('statsbomb/matches/', competition_list)
-    combined_file_path = "statsbomb/sb_matches.json"
-    combine_files(combined_file_path,fs)  
+    combined_file_path = "statsbomb/sb_matches" + ext
+    combine_files(combined_file_path,fs,file_format=file_format,workers=workers,incremental=incremental)  
 
-    # get match_id of La Liga season 2018/2019, 2019/2020 and 2020/2021 
-    # and Premier League season 2003/2004 matches
+    # get match_id of the selected seasons from the match files directly
     # to load only relevant data for lineups and events
-    with open('statsbomb/sb_matches.json', encoding='utf-8') as f:
-        data = json.load(f)
-        df = [str(x['match_id'])+'.json' for x in data
-                if (x['competition']['competition_name']=='La Liga' and x['season']['season_name'] in ['2018/2019','2019/2020','2020/2021']) 
-                or (x['competition']['competition_name']=='Premier League' and x['season']['season_name']=='2003/2004')
-             ] 
+    match_index = get_match_index(resolved)
+    print(f'{len(match_index)} matches selected')
+    df = {f'{match_id}.json' for match_id in match_index}
 
     fs = get_files('statsbomb/lineups/', file_list = df)
-    combined_file_path = "statsbomb/sb_lineups.json"
-    combine_files(combined_file_path,fs)  
+    combined_file_path = "statsbomb/sb_lineups" + ext
+    combine_files(combined_file_path,fs,file_format=file_format,workers=workers,incremental=incremental)  
 
     fs = get_files('statsbomb/events/', file_list = df)
-    combined_file_path = "statsbomb/sb_events.json"
-    combine_files(combined_file_path,fs)  
+    combined_file_path = "statsbomb/sb_events" + ext
+    combine_files(combined_file_path,fs,file_format=file_format,workers=workers,incremental=incremental,
+                  columns=event_columns)  
 
 
 # main program
@@ -0,0 +1,460 @@
+'''
+----------------------------------------------------------------------------------------
+Field mapping between the statsbomb event json and the events table
+
+Each event attribute is described once, in event_main_spec (attributes common to
+all events) or event_data_spec (attributes under an event type object such as
+'pass' or 'shot'). Everything sb_loader needs is generated from these two lists
+when the module is imported, or by get_event_fields() for what depends on the
+columns of events:
+
+1. the DDL of tmp_event_main and tmp_event_data
+2. the SQL expressions / INSERT statements extracting the attributes from sb_events,
+   and the stored generated columns of sb_events holding its hot keys
+3. the column order of the events table, its DDL with the generated point columns
+   (plain or partitioned) and the SQL of its compact form (events_compact and the
+   events view)
+4. a python extractor per event type, used to build events rows on the client
+   side and COPY them into the database
+
+Adding an attribute only needs one more line in event_data_spec. get_event_fields()
+takes freeze_frame_json, to build events with or without the _freeze_frame column
+----------------------------------------------------------------------------------------
+'''
+
+import json
+from types import SimpleNamespace
+
+
+# -------------------------------------------------------------------------
+# (column, sql type, json path, kind)
+#   json path: keys separated by '.', from the event (event_main_spec) or
+#              from the event type object (event_data_spec)
+#   kind: value      -> scalar value cast to the sql type
+#         json       -> json object kept as jsonb
+#         point      -> [x, y] location as decimal []
+#         point3     -> [x, y, z] location as decimal [] (z may be NULL)
+#         match_file -> match id taken from the file name (<match_id>.json)
+# -------------------------------------------------------------------------
+event_main_spec = [
+    ('event_id',            'uuid',         'id',                   'value'),
+    ('index',               'integer',      'index',                'value'),
+    ('period',              'integer',      'period',               'value'),
+    ('timestamp',           'time',         'timestamp',            'value'),
+    ('minute',              'integer',      'minute',               'value'),
+    ('second',              'integer',      'second',               'value'),
+    ('type',                'varchar(32)',  'type.name',            'value'),
+    ('possession',          'integer',      'possession',           'value'),
+    ('possession_team_id',  'integer',      'possession_team.id',   'value'),
+    ('play_pattern',        'jsonb',        'play_pattern',         'json'),
+    ('team_id',             'integer',      'team.id',              'value'),
+    ('player_id',           'integer',      'player.id',            'value'),
+    ('position',            'varchar(32)',  'position.name',        'value'),
+    ('location',            'decimal []',   'location',             'point'),
+    ('duration',            'decimal',      'duration',             'value'),
+    ('under_pressure',      'boolean',      'under_pressure',       'value'),
+    ('off_camera',          'boolean',      'off_camera',           'value'),
+    ('out',                 'boolean',      'out',                  'value'),
+    ('match_id',            'integer',      'file_name',            'match_file'),
+]
+
+# (event type, column, sql type, json path, kind)
+# an event holds a single event type object; when several types fill the
+# same column, the types are tried in the order of this list
+event_data_spec = [
+    ('50_50',           '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('50_50',           '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('bad_behaviour',   '_card',                'varchar(32)',  'card.name',            'value'),
+    ('ball_receipt',    '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('ball_recovery',   '_offensive',           'boolean',      'offensive',            'value'),
+    ('ball_recovery',   '_recovery_failure',    'boolean',      'recovery_failure',     'value'),
+    ('block',           '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('block',           '_deflection',          'boolean',      'deflection',           'value'),
+    ('block',           '_offensive',           'boolean',      'offensive',            'value'),
+    ('block',           '_save_block',          'boolean',      'save_block',           'value'),
+    ('carry',           '_end_location',        'decimal []',   'end_location',         'point'),
+    ('clearance',       '_aerial_won',          'boolean',      'aerial_won',           'value'),
+    ('clearance',       '_body_part',           'varchar(32)',  'body_part.name',       'value'),
+    ('dribble',         '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('dribble',         '_nutmeg',              'boolean',      'nutmeg',               'value'),
+    ('dribble',         '_overrun',             'boolean',      'overrun',              'value'),
+    ('dribble',         '_no_touch',            'boolean',      'no_touch',             'value'),
+    ('dribbled_past',   '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('duel',            '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('duel',            '_type',                'varchar(32)',  'type.name',            'value'),
+    ('duel',            '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('foul_committed',  '_advantage',           'boolean',      'advantage',            'value'),
+    ('foul_committed',  '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('foul_committed',  '_offensive',           'boolean',      'offensive',            'value'),
+    ('foul_committed',  '_penalty',             'boolean',      'penalty',              'value'),
+    ('foul_committed',  '_card',                'varchar(32)',  'card.name',            'value'),
+    ('foul_committed',  '_type',                'varchar(32)',  'type.name',            'value'),
+    ('foul_won',        '_advantage',           'boolean',      'advantage',            'value'),
+    ('foul_won',        '_defensive',           'boolean',      'defensive',            'value'),
+    ('foul_won',        '_penalty',             'boolean',      'penalty',              'value'),
+    ('goalkeeper',      '_position',            'varchar(32)',  'position.name',        'value'),
+    ('goalkeeper',      '_technique',           'varchar(32)',  'technique.name',       'value'),
+    ('goalkeeper',      '_body_part',           'varchar(32)',  'body_part.name',       'value'),
+    ('goalkeeper',      '_type',                'varchar(32)',  'type.name',            'value'),
+    ('goalkeeper',      '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('half_end',        '_early_video_end',     'boolean',      'early_video_end',      'value'),
+    ('half_end',        '_match_suspended',     'boolean',      'match_suspended',      'value'),
+    ('half_start',      '_late_video_start',    'boolean',      'late_video_start',     'value'),
+    ('injury_stoppage', '_in_chain',            'boolean',      'in_chain',             'value'),
+    ('interception',    '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('miscontrol',      '_aerial_won',          'boolean',      'aerial_won',           'value'),
+    ('pass',            '_recipient_id',        'integer',      'recipient.id',         'value'),
+    ('pass',            '_length',              'decimal',      'length',               'value'),
+    ('pass',            '_angle',               'decimal',      'angle',                'value'),
+    ('pass',            '_height',              'varchar(32)',  'height.name',          'value'),
+    ('pass',            '_end_location',        'decimal []',   'end_location',         'point'),
+    ('pass',            '_assisted_shot_id',    'uuid',         'assisted_shot_id',     'value'),
+    ('pass',            '_backheel',            'boolean',      'backheel',             'value'),
+    ('pass',            '_deflected',           'boolean',      'deflected',            'value'),
+    ('pass',            '_miscommunication',    'boolean',      'miscommunication',     'value'),
+    ('pass',            '_cross',               'boolean',      'cross',                'value'),
+    ('pass',            '_cut_back',            'boolean',      'cut_back',             'value'),
+    ('pass',            '_switch',              'boolean',      'switch',               'value'),
+    ('pass',            '_shot_assist',         'boolean',      'shot_assist',          'value'),
+    ('pass',            '_goal_assist',         'boolean',      'goal_assist',          'value'),
+    ('pass',            '_body_part',           'varchar(32)',  'body_part.name',       'value'),
+    ('pass',            '_type',                'varchar(32)',  'type.name',            'value'),
+    ('pass',            '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('pass',            '_technique',           'varchar(32)',  'technique.name',       'value'),
+    ('player_off',      '_permanent',           'boolean',      'permanent',            'value'),
+    ('pressure',        '_counterpress',        'boolean',      'counterpress',         'value'),
+    ('shot',            '_key_pass_id',         'uuid',         'key_pass_id',          'value'),
+    ('shot',            '_end_location',        'decimal []',   'end_location',         'point3'),
+    ('shot',            '_aerial_won',          'boolean',      'aerial_won',           'value'),
+    ('shot',            '_follows_dribble',     'boolean',      'follows_dribble',      'value'),
+    ('shot',            '_first_time',          'boolean',      'first_time',           'value'),
+    ('shot',            '_freeze_frame',        'jsonb',        'freeze_frame',         'json'),
+    ('shot',            '_open_goal',           'boolean',      'open_goal',            'value'),
+    ('shot',            '_statsbomb_xg',        'decimal',      'statsbomb_xg',         'value'),
+    ('shot',            '_deflected',           'boolean',      'deflected',            'value'),
+    ('shot',            '_technique',           'varchar(32)',  'technique.name',       'value'),
+    ('shot',            '_body_part',           'varchar(32)',  'body_part.name',       'value'),
+    ('shot',            '_type',                'varchar(32)',  'type.name',            'value'),
+    ('shot',            '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+    ('substitution',    '_replacement_id',      'integer',      'replacement.id',       'value'),
+    ('substitution',    '_outcome',             'varchar(32)',  'outcome.name',         'value'),
+]
+
+# -------------------------------------------------------------------------
+# to build the sql expression extracting an attribute from sb_events.data
+#   base: json path of the event type object ('' for the main attributes)
+# -------------------------------------------------------------------------
+def get_sql_expr(sql_type, path, kind, base = ''):
+    keys = ([base] if base else []) + path.split('.')
+    obj = 'data' + ''.join(f"->'{k}'" for k in keys)
+    text = 'data' + ''.join(f"->'{k}'" for k in keys[:-1]) + f"->>'{keys[-1]}'"
+
+    if kind == 'json':
+        return obj
+    if kind in ('point', 'point3'):
+        n = 3 if kind == 'point3' else 2
+        return 'ARRAY[' + ','.join(f'(({obj})[{i}])::decimal' for i in range(n)) + ']'
+    if kind == 'match_file':
+        return f"REPLACE({text},'.json','')::integer"
+
+    if sql_type.startswith('varchar'):
+        # no cast, a value too long for the column raises an error
+        return f'({text})'
+    return f'({text})::{sql_type}'
+
+
+# -------------------------------------------------------------------------
+# to build the python function returning the value of an attribute from a
+# decoded event, as COPY text (None for NULL), see get_sql_expr()
+# -------------------------------------------------------------------------
+def get_extractor(sql_type, path, kind, base = ''):
+    keys = ([base] if base else []) + path.split('.')
+
+    def get(d):
+        for k in keys:
+            if type(d) is not dict: return None
+            d = d.get(k)
+        return d
+
+    if kind == 'json':
+        return lambda d: None if get(d) is None else json.dumps(get(d))
+    if kind in ('point', 'point3'):
+        n = 3 if kind == 'point3' else 2
+        def point(d):
+            p = get(d)
+            if type(p) is not list: p = []
+            return '{' + ','.join(to_text(p[i]) if i < len(p) and p[i] is not None else 'NULL' for i in range(n)) + '}'
+        return point
+    if kind == 'match_file':
+        return lambda d: None if get(d) is None else get(d).replace('.json','')
+
+    return lambda d: to_text(get(d))
+
+
+# -------------------------------------------------------------------------
+# to convert a json value to the text the ->> operator would return
+# -------------------------------------------------------------------------
+def to_text(v):
+    if v is None: return None
+    if v is True: return 'true'
+    if v is False: return 'false'
+    if type(v) in (dict, list): return json.dumps(v)
+    return str(v)
+
+
+
+
+# -------------------------------------------------------------------------
+# generated from the specs, the statements and extractors depending on the
+# columns of events are built by get_event_fields()
+# -------------------------------------------------------------------------
+event_main_columns = [c for (c, t, p, k) in event_main_spec]
+
+# event types in spec order
+event_types = list(dict.fromkeys(e for (e, c, t, p, k) in event_data_spec))
+
+
+def get_ddl(table_name, columns):
+    return (f'CREATE TABLE IF NOT EXISTS {table_name}\n'
+            + '( event_id uuid primary key\n'
+            + ''.join(f', {c} {t}\n' for (c, t) in columns if c != 'event_id')
+            + ');')
+
+
+tmp_event_main_ddl = get_ddl('tmp_event_main', [(c, t) for (c, t, p, k) in event_main_spec])
+
+# stored generated columns of sb_events (column, sql type, expression): the
+# keys read by every statement are extracted once when the raw events are
+# loaded, and indexed (sb_events_indexes)
+#   type_key: key of the event type object of the event ('pass', 'shot'...)
+sb_events_generated = [(c, t, get_sql_expr(t, p, k)) for (c, t, p, k) in event_main_spec
+                       if c in ('event_id', 'type', 'match_id')]
+sb_events_generated.append(('type_key', 'varchar(32)',
+                            'CASE ' + ' '.join(f"WHEN data->'{e}' IS NOT NULL THEN '{e}'" for e in event_types) + ' END'))
+sb_events_indexes = ['type_key', 'match_id', 'event_id']
+
+# columns of sb_events, the raw event is loaded into data
+sb_events_columns_ddl = ('data jsonb'
+                         + ''.join(f', {c} {t} GENERATED ALWAYS AS ({x}) STORED' for (c, t, x) in sb_events_generated))
+
+event_main_exprs = [f'sb_events.{c}' if c in [g for (g, t, x) in sb_events_generated] else get_sql_expr(t, p, k)
+                    for (c, t, p, k) in event_main_spec]
+
+tmp_event_main_insert = (f"INSERT INTO tmp_event_main ({','.join(event_main_columns)}) "
+                         f"(SELECT {','.join(event_main_exprs)} FROM sb_events)")
+
+# partition keys of the partitioned events: competition_id and season_id
+# taken from matches. Partitioned by competition, then by season
+event_partition_keys = ['competition_id', 'season_id']
+
+# point columns of events (column, expression), generated from the location
+# arrays (x, y on the 120 x 80 pitch) so zone filters can use a GiST index,
+# see sb_loader.db_gist_indexes and sb_zones
+event_point_columns = [
+    ('location_point',      'point(location[1], location[2])'),
+    ('end_location_point',  'point(_end_location[1], _end_location[2])'),
+]
+
+# built sets of fields, see get_event_fields()
+event_fields = {}
+
+
+# -------------------------------------------------------------------------
+# to get the statements and extractors of the events table, generated from
+# the specs. Returns a namespace holding:
+#   event_data_spec, event_data_types, event_data_columns, event_columns,
+#   event_sql_types: the attribute columns and the column order of events
+#   events_ddl, events_partitioned_ddl: the events table with its
+#   generated point columns, plain or partitioned
+#   tmp_event_data_ddl, tmp_event_data_inserts, events_insert: the
+#   multi-pass load through tmp_event_main and tmp_event_data
+#   events_single_pass_insert, get_partitioned_insert(): the single pass
+#   load from sb_events
+#   event_compact_spec, event_compact_columns, event_labels_insert,
+#   play_patterns_insert, events_compact_ddl, events_compact_insert,
+#   events_compact_view: the compact form of events
+#   get_event_row(): the events row of a decoded event
+#   freeze_frame_json: keep (True) or leave out (False) the _freeze_frame
+#                      column of events. The shot freeze frames are always
+#                      loaded row by row into event_freeze_frames (see
+#                      sb_loader), False leaves the large jsonb out of events
+# -------------------------------------------------------------------------
+def get_event_fields(freeze_frame_json = True):
+    if freeze_frame_json in event_fields:
+        return event_fields[freeze_frame_json]
+
+    data_spec = [(e, c, t, p, k) for (e, c, t, p, k) in event_data_spec
+                 if freeze_frame_json or c != '_freeze_frame']
+
+    # sql type of each attribute column, the same column must keep its type
+    # across event types
+    data_types = {}
+    for (e, c, t, p, k) in data_spec:
+        if data_types.setdefault(c, t) != t:
+            raise ValueError(f'column {c} defined with types {data_types[c]} and {t}')
+    data_columns = sorted(data_types)
+    types = list(dict.fromkeys(e for (e, c, t, p, k) in data_spec))
+
+    # column order of table events
+    columns = event_main_columns + data_columns
+    sql_types = dict([(c, t) for (c, t, p, k) in event_main_spec] + list(data_types.items()))
+
+    # {event type: [(column, sql expression)]}
+    type_exprs = {e: [] for e in types}
+    for (e, c, t, p, k) in data_spec:
+        type_exprs[e].append((c, get_sql_expr(t, p, k, base = e)))
+
+    # {event type: INSERT INTO tmp_event_data ... for the events of that type}
+    data_inserts = {}
+    for e in types:
+        cols = ','.join(c for (c, x) in type_exprs[e])
+        exprs = ','.join(x for (c, x) in type_exprs[e])
+        data_inserts[e] = (f"INSERT INTO tmp_event_data (event_id,{cols}) "
+                           f"(SELECT sb_events.event_id,{exprs} FROM sb_events WHERE sb_events.type_key = '{e}')")
+
+    # single pass over sb_events, an attribute column takes the expression of
+    # the event type present in the event
+    single_pass_exprs = list(event_main_exprs)
+    for c in data_columns:
+        exprs = [f"CASE WHEN data->'{e}' IS NOT NULL THEN {x} END"
+                 for e in types for (col, x) in type_exprs[e] if col == c]
+        single_pass_exprs.append(exprs[0] if len(exprs) == 1 else 'COALESCE(' + ','.join(exprs) + ')')
+
+    # ---------------------------------------------------------------------
+    # to build the single pass INSERT into a partitioned events table (or
+    # one of its partitions), the partition keys come from matches
+    #   table_name: table to insert into
+    #   where: optional condition on sb_events / matches
+    # ---------------------------------------------------------------------
+    def get_partitioned_insert(table_name = 'events', where = ''):
+        match_expr = event_main_exprs[event_main_columns.index('match_id')]
+        return (f"INSERT INTO {table_name} ({','.join(columns + event_partition_keys)}) "
+                f"SELECT {','.join(single_pass_exprs)},matches.competition_id,matches.season_id "
+                f"FROM sb_events JOIN matches ON matches.match_id = {match_expr}"
+                + (f' WHERE {where}' if where else ''))
+
+    # compact events (see sb_loader.compact_events()), the events columns are
+    # stored in events_compact as:
+    #   categorical (varchar) columns -> <column>_id, smallint id of the value
+    #                                    in the event_labels dictionary
+    #   play_pattern                  -> play_pattern_id, see play_patterns
+    #   location                      -> location_point (a location of two
+    #                                    nulls comes back as NULL)
+    #   _end_location                 -> real [] (2 or 3 values)
+    #   other columns                 -> unchanged (point columns included)
+    # and the events view rebuilds the events columns from events_compact
+    label_columns = [c for c in columns if sql_types[c].startswith('varchar')]
+
+    # (events column, [(compact column, sql type, expression over events e)],
+    #  expression over events_compact c rebuilding the events column)
+    compact_spec = []
+    for c in columns + [c for (c, x) in event_point_columns]:
+        if c in label_columns:
+            compact_spec.append((c, [(f'{c}_id', 'smallint', f'l_{c}.label_id')], f'l_{c}.label'))
+        elif c == 'play_pattern':
+            compact_spec.append((c, [('play_pattern_id', 'smallint', "(e.play_pattern->>'id')::smallint")],
+                                 "CASE WHEN c.play_pattern_id IS NOT NULL THEN "
+                                 "jsonb_build_object('id', c.play_pattern_id, 'name', p.play_pattern_name) END"))
+        elif c == 'location':
+            compact_spec.append((c, [], 'CASE WHEN c.location_point IS NOT NULL THEN '
+                                        'ARRAY[c.location_point[0], c.location_point[1]]::decimal [] END'))
+        elif c in dict(event_point_columns):
+            compact_spec.append((c, [(c, 'point', f'e.{c}')], f'c.{c}'))
+        elif c == '_end_location':
+            compact_spec.append((c, [(c, 'real []', f'e.{c}::real []')], f'c.{c}::decimal []'))
+        else:
+            compact_spec.append((c, [(c, sql_types[c], f'e.{c}')], f'c.{c}'))
+    compact_columns = [(n, t, x) for (c, cols, d) in compact_spec for (n, t, x) in cols]
+
+    # column definitions of events, the generated point columns come last
+    columns_ddl = [f'{c} {sql_types[c]}' for c in columns]
+    points_ddl = [f'{c} point GENERATED ALWAYS AS ({x}) STORED' for (c, x) in event_point_columns]
+
+    # python extractors: main attributes and, per event type, (column position, extractor)
+    main_extractors = [get_extractor(t, p, k) for (c, t, p, k) in event_main_spec]
+    type_extractors = {e: [] for e in types}
+    for (e, c, t, p, k) in data_spec:
+        type_extractors[e].append((columns.index(c), get_extractor(t, p, k, base = e)))
+
+    # ---------------------------------------------------------------------
+    # to build the events row of a decoded event, as COPY text values
+    # (None for NULL), in the order of event_columns
+    # ---------------------------------------------------------------------
+    def get_event_row(d):
+        row = [f(d) for f in main_extractors] + [None] * len(data_columns)
+
+        for e in types:
+            if e not in d: continue
+            for (i, f) in type_extractors[e]:
+                if row[i] is None: row[i] = f(d)
+
+        return row
+
+    fields = SimpleNamespace(
+        freeze_frame_json = freeze_frame_json,
+        event_data_spec = data_spec,
+        event_data_types = data_types,
+        event_data_columns = data_columns,
+        event_columns = columns,
+        event_sql_types = sql_types,
+
+        tmp_event_data_ddl = get_ddl('tmp_event_data', [(c, data_types[c]) for c in data_columns]),
+        tmp_event_data_inserts = data_inserts,
+
+        # the events columns followed by the generated point columns, keys
+        # and indexes are built once the data is loaded
+        events_ddl = ('CREATE TABLE events\n'
+                      + '( ' + '\n, '.join(columns_ddl + points_ddl)
+                      + '\n)'),
+
+        # combine tmp_event_main and tmp_event_data into events
+        events_insert = (f"INSERT INTO events ({','.join(columns)}) SELECT tmp_event_main.event_id, "
+                         + ', '.join(columns[1:])
+                         + ' FROM tmp_event_main NATURAL LEFT JOIN tmp_event_data'),
+
+        events_single_pass_insert = (f"INSERT INTO events ({','.join(columns)}) "
+                                     f"SELECT {','.join(single_pass_exprs)} FROM sb_events"),
+        get_partitioned_insert = get_partitioned_insert,
+
+        # partitioned events: the events columns, the partition keys and the
+        # generated point columns
+        events_partitioned_ddl = ('CREATE TABLE events\n'
+                                  + '( ' + '\n, '.join(columns_ddl
+                                                       + [f'{c} integer not null' for c in event_partition_keys]
+                                                       + points_ddl)
+                                  + '\n) PARTITION BY LIST (competition_id)'),
+
+        event_compact_spec = compact_spec,
+        # {events column: [events_compact columns]}, location is read from location_point
+        event_compact_columns = {c: [n for (n, t, x) in cols] or ['location_point'] for (c, cols, d) in compact_spec},
+
+        event_labels_insert = ('INSERT INTO event_labels (label) SELECT DISTINCT v FROM events, LATERAL (VALUES '
+                               + ','.join(f'({c})' for c in label_columns) + ') x(v) WHERE v IS NOT NULL ORDER BY 1'),
+        play_patterns_insert = ("INSERT INTO play_patterns (play_pattern_id, play_pattern_name) "
+                                "SELECT DISTINCT ON (1) (play_pattern->>'id')::smallint, play_pattern->>'name' "
+                                "FROM events WHERE play_pattern IS NOT NULL ORDER BY 1, 2"),
+        events_compact_ddl = ('CREATE TABLE events_compact\n'
+                              + '( ' + '\n, '.join(f'{n} {t}' for (n, t, x) in compact_columns)
+                              + '\n)'),
+        events_compact_insert = (f"INSERT INTO events_compact ({','.join(n for (n, t, x) in compact_columns)}) "
+                                 f"SELECT {','.join(x for (n, t, x) in compact_columns)} FROM events e"
+                                 + ''.join(f' LEFT JOIN event_labels l_{c} ON l_{c}.label = e.{c}' for c in label_columns)),
+        events_compact_view = ('CREATE VIEW events AS SELECT '
+                               + ', '.join(f'{d} AS {c}' for (c, cols, d) in compact_spec)
+                               + ' FROM events_compact c'
+                               + ''.join(f' LEFT JOIN event_labels l_{c} ON l_{c}.label_id = c.{c}_id' for c in label_columns)
+                               + ' LEFT JOIN play_patterns p ON p.play_pattern_id = c.play_pattern_id'),
+
+        get_event_row = get_event_row,
+    )
+    event_fields[freeze_frame_json] = fields
+    return fields
+
+
+# -------------------------------------------------------------------------
+# to format a row as a line of the COPY text format
+# -------------------------------------------------------------------------
+def get_copy_line(row):
+    return '\t'.join('\\N' if v is None else
+                     v.replace('\\', '\\\\').replace('\t', '\\t').replace('\n', '\\n').replace('\r', '\\r')
+                     for v in row) + '\n'
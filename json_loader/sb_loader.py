@@ -13,19 +13,160 @@ This code will
 '''
 
 import psycopg
+from psycopg.types.json import Jsonb
+from psycopg.conninfo import make_conninfo
+import os
 import json
+import hashlib
+import time
 import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+import sb_combine
+import sb_fields
+import sb_stats
+import sb_possessions
+
+# connection settings of the database the data is loaded into, see connect()
+db_settings = {
+    # 'dbname': 'statsbomb',
+    'dbname': '3005',
+    'user': 'postgres',
+    'password': '8023',
+    'host': 'localhost',
+    'port': 5432,
+}
+
+# indexes built by finalize_db() once all the data is loaded (name, table,
+# columns), largest first so the long builds start early
+db_indexes = [
+    ('idx_events_type', 'events', ['type']),
+    ('idx_events_player', 'events', ['player_id']),
+    ('idx_events_team', 'events', ['team_id']),
+    ('idx_events_recipient', 'events', ['_recipient_id']),
+    ('idx_events_first_time', 'events', ['_first_time']),
+    ('idx_events_technique', 'events', ['_technique']),
+    ('idx_events_outcome', 'events', ['_outcome']),
+    ('idx_event_related_related_event', 'event_related', ['related_event', 'event_id']),
+    ('idx_event_tactics_player', 'event_tactics', ['player_id', 'event_id']),
+    ('idx_event_tactics_formation', 'event_tactics', ['formation', 'event_id']),
+    ('idx_event_freeze_frames_event', 'event_freeze_frames', ['event_id']),
+    ('idx_event_freeze_frames_player', 'event_freeze_frames', ['player_id']),
+    ('idx_persons_name', 'persons', ['name']),
+    ('idx_teams_name', 'teams', ['team_name']),
+    ('idx_matches_competition_name', 'matches', ['competition_name']),
+    ('idx_matches_season_name', 'matches', ['season_name']),
+]
+
+# GiST indexes built by finalize_db() (name, table, columns), the point
+# columns of events answer the zone filters of sb_zones
+db_gist_indexes = [
+    ('idx_events_location', 'events', ['location_point']),
+    ('idx_events_end_location', 'events', ['end_location_point']),
+]
+
+# primary keys built by finalize_db() (table, constraint, columns)
+db_primary_keys = [
+    ('events', 'events_pkey', ['event_id']),
+    ('event_related', 'event_related_pkey', ['event_id', 'related_event']),
+    ('event_tactics', 'event_tactics_pkey', ['event_id', 'player_id']),
+]
+
+# partition key columns of the tables that can be partitioned, they are
+# part of the primary key when the table is partitioned
+partition_keys = {
+    'events': sb_fields.event_partition_keys,
+}
+
+# tables that can be stored compact behind a view of the same name
+# (table -> (compact table, function of freeze_frame_json returning
+# {column: [compact columns]})), see compact_events()
+compact_tables = {
+    'events': ('events_compact', lambda freeze_frame_json: sb_fields.get_event_fields(freeze_frame_json).event_compact_columns),
+}
+
+# sb tables whose records are tagged with the file name of their match
+# (<match_id>.json), see import_json_file()
+match_file_tables = ['sb_lineups', 'sb_events']
+
+# tables only needed while loading, see drop_staging()
+staging_tables = ['sb_competitions', 'sb_lineups', 'sb_matches', 'sb_events', 'tmp_event_main', 'tmp_event_data']
+
+# rows of event_related, event_tactics and event_freeze_frames, built from sb_events
+event_related_select = '''
+        SELECT event_id
+             , related_event::uuid
+        FROM sb_events
+           , JSONB_ARRAY_ELEMENTS_TEXT(data->'related_events') related_event
+        WHERE data->>'related_events' IS NOT NULL
+    '''
+event_tactics_select = '''
+        SELECT event_id
+             , data->'tactics'->>'formation' formation
+             , (lineup.player->>'id')::integer player_id
+             , lineup.jersey_number
+        FROM sb_events
+            , JSONB_TO_RECORDSET(data->'tactics'->'lineup') lineup(player jsonb, position jsonb, jersey_number integer)
+        WHERE data->'tactics' IS NOT NULL
+    '''
+event_freeze_frames_select = '''
+        SELECT event_id
+             , (frame.player->>'id')::integer player_id
+             , frame.teammate
+             , (frame.location->>0)::real x
+             , (frame.location->>1)::real y
+             , (frame.position->>'id')::integer position_id
+        FROM sb_events
+            , JSONB_TO_RECORDSET(data->'shot'->'freeze_frame') frame(player jsonb, location jsonb, position jsonb, teammate boolean)
+        WHERE sb_events.type_key = 'shot'
+    '''
+
+# tables of rows derived from single events (table, SELECT from sb_events),
+# see delete_event_rows() and insert_event_rows()
+event_child_tables = [
+    ('event_related', event_related_select),
+    ('event_tactics', event_tactics_select),
+    ('event_freeze_frames', event_freeze_frames_select),
+]
+
+# columns of matches, in the order of the INSERT of load_match_data()
+matches_columns = ['match_id', 'match_date', 'kick_off', 'competition_id', 'season_id', 'competition_name',
+                   'season_name', 'home_team_id', 'away_team_id', 'home_team_group', 'away_team_group',
+                   'home_score', 'away_score', 'match_week', 'stadium_id', 'referee_id', 'competition_stage']
+
+# foreign keys added NOT VALID and then validated by finalize_db()
+# (table, constraint, column, referenced table)
+db_foreign_keys = [
+    ('events', 'events_match_id_fkey', 'match_id', 'matches'),
+    ('events', 'events_team_id_fkey', 'team_id', 'teams'),
+    ('events', 'events_possession_team_id_fkey', 'possession_team_id', 'teams'),
+    ('events', 'events_player_id_fkey', 'player_id', 'persons'),
+    ('events', 'events__recipient_id_fkey', '_recipient_id', 'persons'),
+    ('events', 'events__replacement_id_fkey', '_replacement_id', 'persons'),
+    ('event_related', 'event_related_event_id_fkey', 'event_id', 'events'),
+    ('event_related', 'event_related_related_event_fkey', 'related_event', 'events(event_id)'),
+    ('event_tactics', 'event_tactics_event_id_fkey', 'event_id', 'events'),
+    ('event_tactics', 'event_tactics_player_id_fkey', 'player_id', 'persons(id)'),
+]
 
 #-----------------------------------------------------------------------
 # To create tables required for the project
 # Existing tables with same name will be deleted 
 #   conn: connection to the database
+#   unlogged: create the tmp_event tables UNLOGGED (no WAL is written
+#             for them, their content is lost if the server crashes)
+#   freeze_frame_json: False -> tmp_event_data has no _freeze_frame column
 #-----------------------------------------------------------------------
-def create_db_schema(conn):
+def create_db_schema(conn, unlogged = False, freeze_frame_json = True):
 
     conn.execute("DROP TABLE IF EXISTS  event_related")
     conn.execute("DROP TABLE IF EXISTS  event_tactics")
+    conn.execute("DROP TABLE IF EXISTS  event_freeze_frames")
+    if get_relkind(conn, 'events') == 'v':
+        conn.execute("DROP VIEW events")
     conn.execute("DROP TABLE IF EXISTS  events")
+    conn.execute("DROP TABLE IF EXISTS  events_compact")
+    conn.execute("DROP TABLE IF EXISTS  event_labels")
+    conn.execute("DROP TABLE IF EXISTS  play_patterns")
     conn.execute("DROP TABLE IF EXISTS  tmp_event_data")
     conn.execute("DROP TABLE IF EXISTS  tmp_event_main")
     conn.execute("DROP TABLE IF EXISTS  managers")
@@ -173,82 +314,33 @@ def create_db_schema(conn):
     '''
     conn.execute(qry)
 
-    # create tmp_event_main
+    # create tmp_event_main, columns from sb_fields.event_main_spec
     print('----- creating table tmp_event_main...')
-    qry = '''
-        CREATE TABLE IF NOT EXISTS tmp_event_main 
-        ( event_id          uuid            primary key
-        , index	            integer	
-        , period	        integer	
-        , timestamp	        time	
-        , minute	        integer	
-        , second	        integer	
-        , type	            varchar(32)
-        , possession	    integer	
-        , possession_team_id integer	
-        , play_pattern	    jsonb
-        , team_id           integer
-        , player_id	        integer	
-        , position          varchar(32)	
-        , location	        decimal []
-        , duration          decimal	
-        , under_pressure	boolean	
-        , off_camera	    boolean	
-        , out	            boolean	
-        , match_id          integer	
-        );
-    '''
-    conn.execute(qry)
+    conn.execute(sb_fields.tmp_event_main_ddl)
 
-    # create tmp_event_data
+    # create tmp_event_data, columns from sb_fields.event_data_spec
     print('----- creating table tmp_event_data...')
+    conn.execute(sb_fields.get_event_fields(freeze_frame_json).tmp_event_data_ddl)
+
+    if unlogged:
+        conn.execute('ALTER TABLE tmp_event_main SET UNLOGGED')
+        conn.execute('ALTER TABLE tmp_event_data SET UNLOGGED')
+
+    # create the season aggregates of events, see sb_stats
+    sb_stats.create_stats_tables(conn)
+
+    # create the possessions of events, see sb_possessions
+    sb_possessions.create_possessions_table(conn)
+
+    # create loaded_matches, fingerprint of the data loaded for each match
+    # (see get_match_fingerprints()) used by update_sbdata()
+    print('----- creating table loaded_matches...')
+    conn.execute("DROP TABLE IF EXISTS loaded_matches")
     qry = '''
-        CREATE TABLE IF NOT EXISTS tmp_event_data
-        ( event_id             uuid        primary key
-        , _advantage           boolean
-        , _aerial_won          boolean
-        , _angle               decimal
-        , _assisted_shot_id    uuid
-        , _backheel            boolean
-        , _body_part           varchar(32)
-        , _card                varchar(32)
-        , _counterpress        boolean
-        , _cross               boolean
-        , _cut_back            boolean
-        , _defensive           boolean
-        , _deflected           boolean
-        , _deflection          boolean
-        , _early_video_end     boolean
-        , _end_location        decimal []
-        , _first_time          boolean
-        , _follows_dribble     boolean
-        , _freeze_frame        jsonb
-        , _goal_assist         boolean
-        , _height              varchar(32)
-        , _in_chain            boolean
-        , _key_pass_id         uuid
-        , _late_video_start    boolean
-        , _length              decimal
-        , _match_suspended     boolean
-        , _miscommunication    boolean
-        , _no_touch            boolean
-        , _nutmeg              boolean
-        , _offensive           boolean
-        , _open_goal           boolean
-        , _outcome             varchar(32)
-        , _overrun             boolean
-        , _penalty             boolean
-        , _permanent           boolean
-        , _position            varchar(32)
-        , _recipient_id        integer
-        , _recovery_failure    boolean
-        , _replacement_id      integer
-        , _save_block          boolean
-        , _shot_assist         boolean
-        , _statsbomb_xg        decimal
-        , _switch              boolean
-        , _technique           varchar(32)
-        , _type                varchar(32)
+        CREATE TABLE IF NOT EXISTS loaded_matches
+        ( match_id      integer     primary key
+        , fingerprint   char(64)    not null
+        , loaded_at     timestamp   default now()
         );
     '''
     conn.execute(qry)
@@ -340,73 +432,307 @@ def create_db_schema(conn):
     conn.commit()
 
 
+#-----------------------------------------------------------------------
+# To connect to the database of db_settings, used by the main() of the
+# json_loader modules
+#   autocommit: see psycopg.connect()
+#-----------------------------------------------------------------------
+def connect(autocommit = False):
+    return psycopg.connect(**db_settings, autocommit = autocommit)
+
+
+#-----------------------------------------------------------------------
+# To find the combined file <name> written by sb_combine
+# (.parquet, .jsonl or .json), the most recent one is used if there
+# are several
+#-----------------------------------------------------------------------
+def get_sb_file_path(name, folder = 'statsbomb/'):
+    paths = [folder + name + ext for ext in ('.parquet','.jsonl','.json')]
+    paths = [p for p in paths if os.path.isfile(p)]
+    if len(paths) == 0:
+        raise FileNotFoundError(f'no combined file found for {folder}{name}')
+
+    return max(paths, key = os.path.getmtime)
+
+
 #-----------------------------------------------------------------------
 # To import json data into a table having a single column named 'data' 
 # with type of jsonb. This is a helper funciton for import_sbdata()
+# The file is decoded incrementally and the records are streamed into the
+# table with COPY in batches of <batch_size>, so memory does not depend on
+# the size of the file
 #   conn: connection to the database
-#   file_path: json file to load
+#   file_path: json, json lines or parquet file to load, read back with
+#              sb_combine.read_combined_file()
 #   table_name: table to store raw json data 
+#   copy_format: 'text' or 'binary' COPY format
+#   batch_size: number of records sent to the server at a time
+#   part: (k, n) to load only the k-th of n shares of the file
+#   match_ids: only load the records of these matches. For the
+#              match_file_tables the other records are skipped before being
+#              decoded, see sb_combine.read_combined_file()
+#-----------------------------------------------------------------------
+def import_json_file(conn, file_path, table_name, copy_format = 'text', batch_size = 1000, part = None,
+                     match_ids = None):
+    file_names = None
+    if match_ids is not None and table_name in match_file_tables:
+        file_names = {f'{m}.json' for m in match_ids}
+    records = sb_combine.read_combined_file(file_path, get_file_format(file_path), part = part,
+                                            file_names = file_names)
+    if match_ids is not None:
+        records = (d for d in records if get_record_match_id(d) in match_ids)
+
+    n = 0
+    with conn.cursor() as cur:
+        if copy_format == 'binary':
+            with cur.copy(f'COPY {table_name} (data) FROM STDIN (FORMAT BINARY)') as copy:
+                copy.set_types(['jsonb'])
+                for batch in get_batches(records, batch_size):
+                    for d in batch:
+                        copy.write_row((Jsonb(d),))
+                    n += len(batch)
+        else:
+            with cur.copy(f'COPY {table_name} (data) FROM STDIN') as copy:
+                for batch in get_batches(records, batch_size):
+                    # json text never holds raw tabs or new lines, only
+                    # backslashes have to be escaped for the COPY text format
+                    copy.write(''.join(json.dumps(d).replace('\\', '\\\\') + '\n' for d in batch))
+                    n += len(batch)
+    print('       # records loaded:',table_name,n)
+
+
 #-----------------------------------------------------------------------
-def import_json_file(conn, file_path, table_name):
-    with open(file_path,"r", encoding = 'utf-8') as json_file:
-        data = json.load(json_file)
-        print('       # json entries:',len(data))
-        with conn.cursor() as cur:
-            cur.executemany(f'INSERT INTO {table_name} (data) VALUES(%s)', [(json.dumps(d),) for d in data])
-            print('       # records loaded:',table_name,cur.rowcount)
+# To get the match id of a record of sb_matches (match_id) or of
+# sb_lineups / sb_events (file name <match_id>.json)
+#-----------------------------------------------------------------------
+def get_record_match_id(d):
+    if 'match_id' in d:
+        return d['match_id']
+    return int(d['file_name'].replace('.json', ''))
+
+
+def get_file_format(file_path):
+    if file_path.endswith('.parquet'): return 'parquet'
+    if file_path.endswith('.jsonl'): return 'jsonl'
+    return 'json'
+
+
+#-----------------------------------------------------------------------
+# To load a file (or a share of it) on a connection of its own
+# This is run in the worker processes of import_sbdata()
+#   conninfo: connection string of the database
+#-----------------------------------------------------------------------
+def import_json_part(conninfo, file_path, table_name, batch_size = 1000, part = None, bulk = False,
+                     match_ids = None):
+    with psycopg.connect(conninfo) as conn:
+        if bulk:
+            set_bulk_session(conn)
+        import_json_file(conn, file_path, table_name, batch_size = batch_size, part = part, match_ids = match_ids)
+        conn.commit()
+
+
+#-----------------------------------------------------------------------
+# To split an iterable of records into lists of at most <batch_size>
+#-----------------------------------------------------------------------
+def get_batches(records, batch_size):
+    batch = []
+    for d in records:
+        batch.append(d)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
         
 
 #-----------------------------------------------------------------------
 # To import sb json data into "temporary" tables named sb_<name>
 #   these sb tables can be dropped after the parsing process complete
 #   conn =  connection to the database
+#   batch_size = number of records sent to the server at a time
+#   workers = number of processes (each with its own connection) used to
+#             load the files. The four files are loaded at the same time
+#             and sb_events is split in <workers> shares. 1 -> load the
+#             files one after the other on <conn>
+#   bulk = create the sb tables UNLOGGED, load them with the
+#          set_bulk_session() settings and ANALYZE them once loaded
+#   match_ids = only load the lineups, matches and events of these
+#               matches (None -> all of them)
 #-----------------------------------------------------------------------
-def import_sbdata(conn):
+def import_sbdata(conn, batch_size = 1000, workers = 1, bulk = False, match_ids = None):
     # create temporary tables to hold statsbomb raw data
+    unlogged = 'UNLOGGED ' if bulk else ''
     conn.execute("DROP TABLE IF EXISTS sb_competitions")
     conn.execute("DROP TABLE IF EXISTS sb_lineups")
     conn.execute("DROP TABLE IF EXISTS sb_matches")
     conn.execute("DROP TABLE IF EXISTS sb_events")
-    conn.execute("CREATE TABLE sb_competitions (data jsonb)")
-    conn.execute("CREATE TABLE sb_lineups (data jsonb)")
-    conn.execute("CREATE TABLE sb_matches (data jsonb)")
-    conn.execute("CREATE TABLE sb_events (data jsonb)")
+    conn.execute(f"CREATE {unlogged}TABLE sb_competitions (data jsonb)")
+    conn.execute(f"CREATE {unlogged}TABLE sb_lineups (data jsonb)")
+    conn.execute(f"CREATE {unlogged}TABLE sb_matches (data jsonb)")
+    conn.execute(f"CREATE {unlogged}TABLE sb_events ({sb_fields.sb_events_columns_ddl})")
+
+    if workers is not None and workers > 1:
+        import_sbdata_parallel(conn, batch_size, workers, bulk, match_ids)
+    else:
+        import_sbdata_serial(conn, batch_size, match_ids)
+
+    # index the generated columns of sb_events, see sb_fields
+    print('----- indexing sb_events...')
+    for column in sb_fields.sb_events_indexes:
+        conn.execute(f'CREATE INDEX idx_sb_events_{column} ON sb_events({column})')
+    conn.commit()
 
+    # fresh statistics for the INSERT ... SELECT steps of parse_sbdata()
+    if bulk:
+        analyze_tables(conn, ['sb_competitions', 'sb_lineups', 'sb_matches', 'sb_events'])
+        conn.commit()
+
+
+#-----------------------------------------------------------------------
+# To load the sb tables one after the other on <conn>, see import_sbdata()
+#-----------------------------------------------------------------------
+def import_sbdata_serial(conn, batch_size, match_ids = None):
     # populate table sb_competitions
     print("----- loading statsbomb/competitions.json...")
-    import_json_file(conn, file_path="statsbomb/competitions.json", table_name="sb_competitions")
+    import_json_file(conn, file_path="statsbomb/competitions.json", table_name="sb_competitions", batch_size=batch_size)
 
     # populate table sb_lineups
-    print("----- loading statsbomb/sb_lineups.json...")
-    import_json_file(conn, file_path="statsbomb/sb_lineups.json", table_name="sb_lineups")
+    file_path = get_sb_file_path('sb_lineups')
+    print(f"----- loading {file_path}...")
+    import_json_file(conn, file_path=file_path, table_name="sb_lineups", batch_size=batch_size, match_ids=match_ids)
 
     # populate table sb_matches
-    print("----- loading statsbomb/matches.json...")
-    import_json_file(conn, file_path="statsbomb/sb_matches.json", table_name="sb_matches")
+    file_path = get_sb_file_path('sb_matches')
+    print(f"----- loading {file_path}...")
+    import_json_file(conn, file_path=file_path, table_name="sb_matches", batch_size=batch_size, match_ids=match_ids)
 
     # populate table sb_events
-    print("----- loading statsbomb/events.json...")
-    import_json_file(conn, file_path="statsbomb/sb_events.json", table_name="sb_events")
+    file_path = get_sb_file_path('sb_events')
+    print(f"----- loading {file_path}...")
+    import_json_file(conn, file_path=file_path, table_name="sb_events", batch_size=batch_size, match_ids=match_ids)
 
     conn.commit()
 
 
+#-----------------------------------------------------------------------
+# To load the sb tables with several processes, see import_sbdata()
+# the sb tables must already exist, they are committed first so the
+# worker connections can see them
+#-----------------------------------------------------------------------
+def import_sbdata_parallel(conn, batch_size, workers, bulk = False, match_ids = None):
+    conn.commit()
+    conninfo = make_conninfo(**conn.info.get_parameters(), password = conn.info.password)
+
+    jobs = [("statsbomb/competitions.json", "sb_competitions", None, None)]
+    jobs.append((get_sb_file_path('sb_lineups'), "sb_lineups", None, match_ids))
+    jobs.append((get_sb_file_path('sb_matches'), "sb_matches", None, match_ids))
+
+    file_path = get_sb_file_path('sb_events')
+    if sb_combine.is_splittable(file_path, get_file_format(file_path)):
+        jobs += [(file_path, "sb_events", (k, workers), match_ids) for k in range(workers)]
+    else:
+        print(f'      {file_path} cannot be split, loading it as a whole')
+        jobs.append((file_path, "sb_events", None, match_ids))
+
+    print(f"----- loading {len(jobs)} files/shares with {workers} workers...")
+    with ProcessPoolExecutor(max_workers = min(workers, len(jobs))) as executor:
+        futures = [executor.submit(import_json_part, conninfo, file_path, table_name, batch_size, part, bulk, ids)
+                   for (file_path, table_name, part, ids) in jobs]
+        # raises the first error from the workers, if any
+        for future in futures:
+            future.result()
+
+
 #-----------------------------------------------------------------------------
 # To extract data from sb tables, transform and load to master data tables
 #   conn =  connection to the database
+#   single_pass = build events in a single pass over sb_events,
+#                 see load_event_data()
+#   events_file = build events on the client side from this combined
+#                 events file, see load_event_data()
+#   workers = number of connections used to build the indexes and keys
+#             once the data is loaded, see finalize_db()
+#   partitioned = build events partitioned by competition and season,
+#                 see load_event_data()
+#   compact = store events dictionary encoded in events_compact behind an
+#             events view, see compact_events()
+#   freeze_frame_json = False: events has no _freeze_frame column, the shot
+#                       freeze frames are only in event_freeze_frames
 #-----------------------------------------------------------------------------
-def parse_sbdata(conn):     
+def parse_sbdata(conn, single_pass = False, events_file = None, workers = 1, partitioned = False,
+                 compact = False, freeze_frame_json = True):     
+    if partitioned and compact:
+        raise ValueError('events cannot be both partitioned and compact')
+
+    # load reference data, matches, players and managers
+    load_match_data(conn)
+
+    # load_event_data
+    load_event_data(conn, single_pass, events_file, partitioned, freeze_frame_json)
+    if compact:
+        compact_events(conn, freeze_frame_json)
+
+    # per player / team season aggregates of events
+    sb_stats.refresh_season_stats(conn)
+
+    # one row per possession of each match
+    sb_possessions.refresh_possessions(conn)
+    
+    # load event data into event_related from sb_events
+    # its primary key, foreign keys and indexes are built by finalize_db()
+    print('----- populating table event_related...')
+    print(f"      {conn.execute('CREATE TABLE event_related AS ' + event_related_select).rowcount} records loaded")
+
+    # load tactics data into event_tactics from sb_events
+    # its primary key, foreign keys and indexes are built by finalize_db()
+    print('----- populating table event_tactics...')
+    print(f"      {conn.execute('CREATE TABLE event_tactics AS ' + event_tactics_select).rowcount} records loaded")
+
+    # load the shot freeze frames into event_freeze_frames from sb_events,
+    # one row per player of a frame, indexed by finalize_db()
+    print('----- populating table event_freeze_frames...')
+    print(f"      {conn.execute('CREATE TABLE event_freeze_frames AS ' + event_freeze_frames_select).rowcount} records loaded")
+
+    conn.commit()
+    print("All data successfully loaded.")
+
+    finalize_db(conn, workers, freeze_frame_json)
+
+
+#-----------------------------------------------------------------------------
+# To load the reference data (countries, stadiums, competitions, seasons,
+# persons, teams), matches, players and managers from the sb tables
+#   conn =  connection to the database
+#   upsert = the tables already hold data (see update_sbdata()): matches
+#            are updated, players and managers rows already there are kept
+#            (reference data rows already there are always kept)
+#-----------------------------------------------------------------------------
+def load_match_data(conn, upsert = False):
+    players_on_conflict = ' ON CONFLICT (player_id, team_id, match_id) DO NOTHING' if upsert else ''
+    managers_on_conflict = ' ON CONFLICT (manager_id, team_id, match_id) DO NOTHING' if upsert else ''
+    matches_on_conflict = (' ON CONFLICT (match_id) DO UPDATE SET '
+                           + ', '.join(f'{c} = EXCLUDED.{c}' for c in matches_columns[1:])) if upsert else ''
+
+    # the reference data is read in one pass per table, home and away sides
+    # of a match are unpivoted with LATERAL (VALUES ...), rows are
+    # deduplicated on their key with DISTINCT ON and rows already in the
+    # table are skipped with ON CONFLICT (<primary key>) DO NOTHING, a
+    # conflict on another unique column (e.g. a name) still raises an error.
+    # The rows of a key are ordered on all their columns, so the row kept
+    # does not depend on the order sb_* is scanned in
+
     # load country data
     print('----- populating table countries...')
     str = '''
         INSERT INTO countries (country_id, country_name)
-            (SELECT DISTINCT 
+            (SELECT DISTINCT ON ((country->>'id')::int)
                 (country->>'id')::int
                 ,country->>'name'
             FROM sb_lineups,
                 jsonb_to_recordset(data->'lineup') country(country jsonb)
-            ORDER BY 2
+            ORDER BY 1, 2
             )
+        ON CONFLICT (country_id) DO NOTHING
         '''
     print(f'      {conn.execute(str).rowcount} records loaded')
 
@@ -414,13 +740,15 @@ def parse_sbdata(conn):
     print('----- populating table stadiums...')
     str = '''
     INSERT INTO stadiums (stadium_id, stadium_name, country_id)
-        (SELECT DISTINCT
+        (SELECT DISTINCT ON ((data->'stadium'->>'id')::int)
             (data->'stadium'->>'id')::int,
             data->'stadium'->>'name',
             (data->'stadium'->'country'->>'id')::int
         FROM sb_matches
         WHERE data->'stadium'->>'id' IS NOT NULL
+        ORDER BY 1, 2, 3
         )
+    ON CONFLICT (stadium_id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
 
@@ -428,7 +756,7 @@ def parse_sbdata(conn):
     print('----- populating table competitions...')
     str = '''
     INSERT INTO competitions (competition_id, competition_name, gender, youth, international, country_name)
-        (SELECT DISTINCT
+        (SELECT DISTINCT ON ((data->>'competition_id')::int)
             (data->>'competition_id')::int
             ,data->>'competition_name'
             ,data->>'competition_gender'
@@ -436,7 +764,9 @@ def parse_sbdata(conn):
             ,(data->>'competition_international')::boolean
             ,data->>'country_name'
         FROM sb_competitions
+        ORDER BY 1, 2, 3, 4, 5, 6
         )
+    ON CONFLICT (competition_id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
 
@@ -444,11 +774,13 @@ def parse_sbdata(conn):
     print('----- populating table seasons...')
     str = '''
     INSERT INTO seasons (season_id, season_name)
-        (SELECT DISTINCT 
+        (SELECT DISTINCT ON ((data->>'season_id')::int)
             (data->>'season_id')::int
             ,data ->>'season_name'
         FROM sb_competitions
+        ORDER BY 1, 2
         )
+    ON CONFLICT (season_id) DO NOTHING
     '''            
     print(f'      {conn.execute(str).rowcount} records loaded')
 
@@ -456,7 +788,7 @@ def parse_sbdata(conn):
     print('----- populating table persons with players data...')
     str = '''
     INSERT INTO persons (id, name, nickname, country_id)
-    (SELECT DISTINCT 
+    (SELECT DISTINCT ON (lineup.player_id)
         lineup.player_id
         ,lineup.player_name
         ,lineup.player_nickname
@@ -468,78 +800,67 @@ def parse_sbdata(conn):
             ,player_name text
             ,player_nickname text
         )
+    ORDER BY 1, 2, 3, 4
     )       
+    ON CONFLICT (id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
-    conn.execute('CREATE INDEX idx_persons_name on persons(name)')
 
-    # load referees from sb_matches into persons
+    # load referees from sb_matches into persons, referees already loaded
+    # as players are skipped
     print('----- populating table persons with referees data...')
     str = '''
         INSERT INTO persons (id,name,country_id)
-        (SELECT DISTINCT
+        (SELECT DISTINCT ON ((data->'referee' ->>'id')::int)
             (data->'referee' ->>'id')::int
             ,data->'referee' ->>'name'
             ,(data->'referee' ->'country'->>'id')::int
         FROM sb_matches
         WHERE data->'referee' ->>'id' IS NOT NULL
-          AND (data->'referee' ->>'id')::int NOT IN (SELECT id FROM persons)
+        ORDER BY 1, 2, 3
         )
+        ON CONFLICT (id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
 
-    # load managers from sb_matches into persons
+    # load managers of both sides from sb_matches into persons, managers
+    # already loaded as players or referees are skipped
     print('----- populating table persons with managers data...')
     str = '''
         INSERT INTO persons (id,name,nickname,dob,country_id)
-        (SELECT DISTINCT
+        (SELECT DISTINCT ON (manager.id)
             manager.id,manager.name,manager.nickname,manager.dob,(manager.country->>'id')::int
         FROM sb_matches,
-            JSONB_TO_RECORDSET(data->'home_team'->'managers') 
+            LATERAL (VALUES (data->'home_team'), (data->'away_team')) side(team),
+            JSONB_TO_RECORDSET(side.team->'managers') 
                 manager(id        integer
                         ,name     text
                         ,nickname text
                         ,dob      date
                         ,country  jsonb
                 )
-        WHERE manager.id NOT IN (SELECT id FROM persons)
-        UNION
-        SELECT DISTINCT
-            manager.id,manager.name,manager.nickname,manager.dob,(manager.country->>'id')::int
-        FROM sb_matches,
-            JSONB_TO_RECORDSET(data->'away_team'->'managers') 
-                manager(id        integer
-                        ,name     text
-                        ,nickname text
-                        ,dob      date
-                        ,country  jsonb
-                )
-        WHERE manager.id NOT IN (SELECT id FROM persons)
+        ORDER BY 1, 2, 3, 4, 5
         )
+        ON CONFLICT (id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
 
-    # load teams from sb_matches into teams
+    # load teams of both sides from sb_matches into teams
     print('----- populating table teams...')
     str = '''
         INSERT INTO teams (team_id,team_name,gender,country_id)
-        (SELECT DISTINCT
-            (data->'home_team'->>'home_team_id')::int
-            ,data->'home_team'->>'home_team_name'
-            ,data->'home_team'->>'home_team_gender'
-            ,(data->'home_team'->'country'->>'id')::int
-        FROM sb_matches
-        UNION
-            SELECT DISTINCT
-                (data->'away_team'->>'away_team_id')::int
-                ,data->'away_team'->>'away_team_name'
-                ,data->'away_team'->>'away_team_gender'
-                ,(data->'away_team'->'country'->>'id')::int
-            FROM sb_matches
+        (SELECT DISTINCT ON ((side.team->>(side.name || '_team_id'))::int)
+            (side.team->>(side.name || '_team_id'))::int
+            ,side.team->>(side.name || '_team_name')
+            ,side.team->>(side.name || '_team_gender')
+            ,(side.team->'country'->>'id')::int
+        FROM sb_matches,
+            LATERAL (VALUES ('home', data->'home_team'), ('away', data->'away_team')) side(name, team)
+        ORDER BY 1, 2, 3, 4
         )
+        ON CONFLICT (team_id) DO NOTHING
     '''
     print(f'      {conn.execute(str).rowcount} records loaded')
-    conn.execute('CREATE INDEX idx_teams_name on teams(team_name)')
 
     # load_matches
     print('----- populating table matches...')
@@ -547,7 +868,7 @@ def parse_sbdata(conn):
         INSERT INTO matches (match_id,match_date,kick_off,competition_id,season_id,competition_name, season_name,
                                 home_team_id,away_team_id,home_team_group,away_team_group,home_score,away_score,
                                 match_week,stadium_id,referee_id,competition_stage)
-        (SELECT DISTINCT
+        (SELECT DISTINCT ON ((data->>'match_id')::int)
             (data->>'match_id')::int
             ,(data->>'match_date')::date
             ,(data->>'kick_off')::time
@@ -566,12 +887,11 @@ def parse_sbdata(conn):
             ,(data->'referee'->>'id')::int
             ,data->'competition_stage'->>'name'
         FROM sb_matches
+        ORDER BY 1, 2, 3, 4, 5, 6, 7, 8, 9, 10, 11, 12, 13, 14, 15, 16, 17
         )
         '''
-    print(f'      {conn.execute(str).rowcount} records loaded')
-    conn.execute('CREATE INDEX idx_matches_competition_name on matches(competition_name)')
-    conn.execute('CREATE INDEX idx_matches_season_name on matches(season_name)')
-    
+    print(f'      {conn.execute(str + matches_on_conflict).rowcount} records loaded')
+
     # load data into players
     print('----- populating table players...')
     str = '''
@@ -584,316 +904,636 @@ def parse_sbdata(conn):
             JSONB_TO_RECORDSET(data->'lineup') lineup(player_id integer)
         )
     '''
-    print(f'      {conn.execute(str).rowcount} records loaded')
+    print(f'      {conn.execute(str + players_on_conflict).rowcount} records loaded')
 
-    # load data into managers
+    # load data into managers, home and away sides in one pass
     print('----- populating table managers...')
     str = '''
         INSERT INTO managers (manager_id,team_id,match_id)
         (SELECT DISTINCT
             manager.id
-            , (data->'home_team'->>'home_team_id')::integer
+            , (side.team->>(side.name || '_team_id'))::integer
             , (data->>'match_id')::integer 
         FROM sb_matches,
-            JSONB_TO_RECORDSET(data->'home_team'->'managers') manager(id integer)
-        WHERE data->'home_team'->'managers' IS NOT NULL
-
-        UNION
-
-        SELECT DISTINCT
-            manager.id
-            , (data->'away_team'->>'away_team_id')::integer
-            , (data->>'match_id')::integer 
-        FROM sb_matches,
-            JSONB_TO_RECORDSET(data->'away_team'->'managers') manager(id integer)
-        WHERE data->'away_team'->'managers' IS NOT NULL
+            LATERAL (VALUES ('home', data->'home_team'), ('away', data->'away_team')) side(name, team),
+            JSONB_TO_RECORDSET(side.team->'managers') manager(id integer)
         )
     '''
-    print(f'      {conn.execute(str).rowcount} records loaded')
+    print(f'      {conn.execute(str + managers_on_conflict).rowcount} records loaded')
 
-    # load event main data into events from sb_events
+
+#-----------------------------------------------------------------------------
+# To extract data from sb_events and load to table events
+# the columns and the way they are extracted come from sb_fields
+#   conn =  connection to the database
+#   single_pass = False: load tmp_event_main, then tmp_event_data with one
+#                 pass over sb_events per event type, and join them
+#                 True: read sb_events once and write the complete events
+#                 rows directly, tmp_event_main and tmp_event_data are not
+#                 used (events is created from the sb_fields specs)
+#   file_path = combined events file (see get_sb_file_path()). When given,
+#               the events rows are built on the client side with the
+#               sb_fields extractors and COPYed into events, sb_events is
+#               not read
+#   partitioned = events is list partitioned by competition_id, then by
+#                 season_id, with one partition per season of matches
+#                 (see create_event_partitions()). The events rows get the
+#                 competition_id and season_id of their match. events is
+#                 loaded in a single pass, or from <file_path> when given
+#                 The queries of queries.py select seasons by name through
+#                 matches, so their plans never prune partitions: the
+#                 partitions serve reload_event_season(), which replaces a
+#                 season without rewriting the others
+#   freeze_frame_json = False: events has no _freeze_frame column
+#-----------------------------------------------------------------------------
+def load_event_data(conn, single_pass = False, file_path = None, partitioned = False, freeze_frame_json = True):
+    fields = sb_fields.get_event_fields(freeze_frame_json)
+
+    if partitioned:
+        conn.execute(fields.events_partitioned_ddl)
+        create_event_partitions(conn)
+        if file_path is not None:
+            load_event_data_copy(conn, file_path, partitioned = True, freeze_frame_json = freeze_frame_json)
+        else:
+            print('----- populating table events (partitioned) in a single pass...')
+            print(f'      {conn.execute(fields.get_partitioned_insert()).rowcount} records loaded')
+        return
+
+    if file_path is not None:
+        load_event_data_copy(conn, file_path, freeze_frame_json = freeze_frame_json)
+        return
+
+    if single_pass:
+        print('----- populating table events in a single pass...')
+        conn.execute(fields.events_ddl)
+        print(f'      {conn.execute(fields.events_single_pass_insert).rowcount} records loaded')
+        return
+
+    # load event main data into tmp_event_main from sb_events
     print('----- populating table tmp_event_main...')
-    str = '''
-        INSERT INTO tmp_event_main (event_id,index,period,timestamp,minute,second,type,
-            possession,possession_team_id,play_pattern,team_id,player_id,position,
-            location,duration,under_pressure,off_camera,out,match_id)
-        (SELECT
-             (data->>'id')::uuid
-            ,(data->>'index')::integer
-            ,(data->>'period')::integer
-            ,(data->>'timestamp')::time
-            ,(data->>'minute')::integer
-            ,(data->>'second')::integer
-            ,data->'type'->>'name'
-            ,(data->>'possession')::integer
-            ,(data->'possession_team'->>'id')::integer
-            ,data->'play_pattern'
-            ,(data->'team'->>'id')::integer
-            ,(data->'player'->>'id')::integer
-            ,data->'position'->>'name'
-            ,ARRAY[((data->'location')[0])::decimal,((data->'location')[1])::decimal]
-            ,(data->>'duration')::decimal
-            ,(data->>'under_pressure')::boolean
-            ,(data->>'off_camera')::boolean
-            ,(data->>'out')::boolean
-            ,REPLACE(data->>'file_name','.json','')::integer     
-        FROM sb_events
-        );
-    '''
-    print(f'      {conn.execute(str).rowcount} records loaded')
+    print(f'      {conn.execute(sb_fields.tmp_event_main_insert).rowcount} records loaded')
 
-    # load_event_data
-    load_event_data(conn)
-    
-    # load event data into event_related from sb_events
-    print('----- populating table event_related...')
-    str = '''
-        CREATE TABLE event_related AS
-        SELECT (data->>'id')::uuid event_id
-             , related_event::uuid
-        FROM sb_events
-           , JSONB_ARRAY_ELEMENTS_TEXT(data->'related_events') related_event
-        WHERE data->>'related_events' IS NOT NULL
-    '''
-    print(f'      {conn.execute(str).rowcount} records loaded')
-    # conn.execute('''ALTER TABLE event_related 
-    #                   ADD PRIMARY KEY (event_id,related_event)
-    #                 , ADD FOREIGN KEY (event_id) REFERENCES events
-    #                 , ADD FOREIGN KEY (related_event) REFERENCES events(event_id)
-    #              ''')
-    # conn.execute('CREATE INDEX idx_event_related ON event_related(related_event')
+    # populate table event_data_wide
+    for (event_type, str) in fields.tmp_event_data_inserts.items():
+        print(f'----- loading data for {event_type}...')
+        print(f'      {conn.execute(str).rowcount} records loaded')
 
-    # load tactics data into event_tactics from sb_events
-    print('----- populating table event_tactics...')
-    str = '''
-        CREATE TABLE event_tactics AS
-        SELECT (data->>'id')::uuid event_id
-             , data->'tactics'->>'formation' formation
-             , (lineup.player->>'id')::integer player_id
-             , lineup.jersey_number
-        FROM sb_events
-            , JSONB_TO_RECORDSET(data->'tactics'->'lineup') lineup(player jsonb, position jsonb, jersey_number integer)
-        WHERE data->'tactics' IS NOT NULL
-    '''
+    # combine tmp_event_main and tmp_event_data into table events for analysis purposes
+    # events is created with its generated point columns first, so its rows
+    # are written once
+    analyze_tables(conn, ['tmp_event_main', 'tmp_event_data'])
+    print('----- populating table events...')
+    conn.execute(fields.events_ddl)
+    print(f'      {conn.execute(fields.events_insert).rowcount} records loaded')
+
+
+#-----------------------------------------------------------------------------
+# To build table events on the client side from the combined events file
+# each event is read once, turned into an events row by get_event_row()
+# (see sb_fields.get_event_fields()) and sent with COPY in batches of
+# <batch_size>
+#   conn =  connection to the database
+#   file_path = combined events file (json, json lines or parquet)
+#   partitioned = events already exists partitioned, the competition_id
+#                 and season_id of each row are looked up in matches and
+#                 events of unknown matches are skipped
+#   freeze_frame_json = False: events has no _freeze_frame column
+#-----------------------------------------------------------------------------
+def load_event_data_copy(conn, file_path, batch_size = 1000, partitioned = False, freeze_frame_json = True):
+    print(f'----- populating table events from {file_path}...')
+    fields = sb_fields.get_event_fields(freeze_frame_json)
+    columns = fields.event_columns
+    if partitioned:
+        columns = columns + sb_fields.event_partition_keys
+        match_keys = {f'{m}': [f'{c}', f'{s}'] for (m, c, s) in
+                      conn.execute('SELECT match_id, competition_id, season_id FROM matches')}
+        match_index = fields.event_columns.index('match_id')
+    else:
+        conn.execute(fields.events_ddl)
+
+    records = sb_combine.read_combined_file(file_path, get_file_format(file_path))
+    n = 0
+    with conn.cursor() as cur:
+        with cur.copy(f"COPY events ({','.join(columns)}) FROM STDIN") as copy:
+            for batch in get_batches(records, batch_size):
+                rows = [fields.get_event_row(d) for d in batch]
+                if partitioned:
+                    rows = [row + match_keys[row[match_index]] for row in rows if row[match_index] in match_keys]
+                copy.write(''.join(sb_fields.get_copy_line(row) for row in rows))
+                n += len(rows)
+    print(f'      {n} records loaded')
+
+
+#-----------------------------------------------------------------------------
+# To get the name of the partition of events holding a season
+#-----------------------------------------------------------------------------
+def get_event_partition_name(competition_id, season_id):
+    return f'events_c{competition_id}_s{season_id}'
+
+
+#-----------------------------------------------------------------------------
+# To create the partitions of the partitioned events table, one per
+# competition and season found in matches
+#   conn =  connection to the database
+#-----------------------------------------------------------------------------
+def create_event_partitions(conn):
+    seasons = conn.execute('SELECT DISTINCT competition_id, season_id FROM matches ORDER BY 1, 2').fetchall()
+    print(f'----- creating {len(seasons)} partitions of events...')
+    for (competition_id, season_id) in seasons:
+        create_event_partition(conn, competition_id, season_id)
+
+
+#-----------------------------------------------------------------------------
+# To create the partition of events for a season. The partition of the
+# competition (events_c<competition_id>, itself partitioned by season_id)
+# is created first if needed
+#   conn =  connection to the database
+#-----------------------------------------------------------------------------
+def create_event_partition(conn, competition_id, season_id):
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS events_c{competition_id} PARTITION OF events
+                     FOR VALUES IN ({competition_id}) PARTITION BY LIST (season_id)''')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS {get_event_partition_name(competition_id, season_id)}
+                     PARTITION OF events_c{competition_id} FOR VALUES IN ({season_id})''')
+
+
+#-----------------------------------------------------------------------------
+# To detach the partition of a season from events, the partition is kept
+# as a standalone table. Returns the name of the table
+#   conn =  connection to the database
+#-----------------------------------------------------------------------------
+def detach_event_partition(conn, competition_id, season_id):
+    table_name = get_event_partition_name(competition_id, season_id)
+    print(f'----- detaching {table_name} from events...')
+    conn.execute(f'ALTER TABLE events_c{competition_id} DETACH PARTITION {table_name}')
+    return table_name
+
+
+#-----------------------------------------------------------------------------
+# To attach a table as the partition of a season of events. The table must
+# have the events columns and hold the events of that season only.
+# A CHECK constraint on the partition keys lets postgres skip the scan
+# checking the rows, the keys and indexes of events are built on the table
+# if it does not have them
+#   conn =  connection to the database
+#   table_name = table to attach
+#-----------------------------------------------------------------------------
+def attach_event_partition(conn, table_name, competition_id, season_id):
+    print(f'----- attaching {table_name} to events...')
+    conn.execute(f'''CREATE TABLE IF NOT EXISTS events_c{competition_id} PARTITION OF events
+                     FOR VALUES IN ({competition_id}) PARTITION BY LIST (season_id)''')
+    conn.execute(f'ALTER TABLE events_c{competition_id} ATTACH PARTITION {table_name} FOR VALUES IN ({season_id})')
+
+
+#-----------------------------------------------------------------------------
+# To reload the events of one season without touching the other partitions
+# The raw data of the matches of the season is imported again from the
+# combined files into the sb tables (the staging tables of the full load
+# may have been dropped, see drop_staging()), then the season is loaded
+# into a new table which replaces the partition of the season. matches
+# must hold the matches of the season
+# the event_related, event_tactics, event_freeze_frames, season aggregates
+# (sb_stats) and possessions (sb_possessions) rows of the season are
+# rebuilt as well. The _freeze_frame column is loaded if events has it
+#   conn =  connection to the database
+#   batch_size, workers, bulk = see import_sbdata()
+#-----------------------------------------------------------------------------
+def reload_event_season(conn, competition_id, season_id, batch_size = 1000, workers = 1, bulk = False):
+    if get_relkind(conn, 'events') != 'p':
+        raise ValueError('events is not partitioned, load it again with main(partitioned=True)')
+
+    fields = sb_fields.get_event_fields(has_freeze_frame_json(conn))
+    table_name = get_event_partition_name(competition_id, season_id)
+    new_table = table_name + '_new'
+    str = 'SELECT match_id FROM matches WHERE competition_id = %s AND season_id = %s'
+    match_ids = [r[0] for r in conn.execute(str, [competition_id, season_id])]
+    if len(match_ids) == 0:
+        raise ValueError(f'no match of competition {competition_id} season {season_id} in matches')
+
+    import_sbdata(conn, batch_size, workers, bulk, match_ids = set(match_ids))
+    delete_event_rows(conn, match_ids)
+
+    print(f'----- loading {new_table}...')
+    conn.execute(f'DROP TABLE IF EXISTS {new_table}')
+    conn.execute(f'CREATE TABLE {new_table} (LIKE events INCLUDING GENERATED)')
+    str = fields.get_partitioned_insert(new_table, f'matches.competition_id = {competition_id} '
+                                                   f'AND matches.season_id = {season_id}')
     print(f'      {conn.execute(str).rowcount} records loaded')
-    # conn.execute('''ALTER TABLE event_tactics 
-    #                 , ADD FOREIGN KEY (event_id) REFERENCES events
-    #                 , ADD FOREIGN KEY (player_id) REFERENCES persons(id)
-    #              ''')
-    # conn.execute('CREATE INDEX idx_event_tactics_player_id ON event_tactics(player_id)')
-    # conn.execute('CREATE INDEX idx_event_tactics_formation ON event_tactics(formation)')
+    conn.execute(f'''ALTER TABLE {new_table} ADD CONSTRAINT {new_table}_keys
+                     CHECK (competition_id = {competition_id} AND season_id = {season_id})''')
+
+    if conn.execute('SELECT to_regclass(%s)', [table_name]).fetchone()[0] is not None:
+        detach_event_partition(conn, competition_id, season_id)
+        conn.execute(f'DROP TABLE {table_name}')
+    conn.execute(f'ALTER TABLE {new_table} RENAME TO {table_name}')
+    attach_event_partition(conn, table_name, competition_id, season_id)
+    conn.execute(f'ALTER TABLE {table_name} DROP CONSTRAINT {new_table}_keys')
+
+    insert_event_rows(conn, match_ids)
+    sb_stats.refresh_season_stats(conn, match_ids)
+    sb_possessions.refresh_possessions(conn, match_ids)
+    conn.commit()
+
+
+#-----------------------------------------------------------------------------
+# To store events compact: the categorical columns are dictionary encoded
+# into smallint ids of event_labels, play_pattern into the id of
+# play_patterns and location into its point column (see sb_fields). The
+# rows go to events_compact and events is replaced by a view rebuilding the
+# original columns, so the queries on events are unchanged
+# the indexes and keys of events are built on events_compact by finalize_db()
+#   conn =  connection to the database
+#   freeze_frame_json = False: events has no _freeze_frame column
+#-----------------------------------------------------------------------------
+def compact_events(conn, freeze_frame_json = True):
+    fields = sb_fields.get_event_fields(freeze_frame_json)
+    print('----- populating table event_labels...')
+    conn.execute('''
+        CREATE TABLE event_labels
+        ( label_id  smallint    generated always as identity primary key
+        , label     varchar(32) unique not null
+        );
+    ''')
+    print(f'      {conn.execute(fields.event_labels_insert).rowcount} records loaded')
+
+    print('----- populating table play_patterns...')
+    conn.execute('''
+        CREATE TABLE play_patterns
+        ( play_pattern_id   smallint    primary key
+        , play_pattern_name varchar(32) not null
+        );
+    ''')
+    print(f'      {conn.execute(fields.play_patterns_insert).rowcount} records loaded')
+
+    print('----- populating table events_compact...')
+    conn.execute(fields.events_compact_ddl)
+    print(f'      {conn.execute(fields.events_compact_insert).rowcount} records loaded')
+
+    str = "SELECT pg_size_pretty(pg_total_relation_size('events')), pg_size_pretty(pg_total_relation_size('events_compact'))"
+    (size, compact_size) = conn.execute(str).fetchone()
+    print(f'      events: {size}, events_compact: {compact_size}')
+
+    print('----- replacing table events with a view...')
+    conn.execute('DROP TABLE events')
+    conn.execute(fields.events_compact_view)
+
+
+#-----------------------------------------------------------------------------
+# To know if the loaded events table has the _freeze_frame column
+#-----------------------------------------------------------------------------
+def has_freeze_frame_json(conn):
+    str = "SELECT 1 FROM information_schema.columns WHERE table_name = 'events' AND column_name = '_freeze_frame'"
+    return conn.execute(str).fetchone() is not None
+
+
+#-----------------------------------------------------------------------------
+# To get the relkind of a relation ('r' table, 'p' partitioned table,
+# 'v' view...), None if it does not exist
+#-----------------------------------------------------------------------------
+def get_relkind(conn, name):
+    row = conn.execute("SELECT relkind FROM pg_class WHERE relname = %s AND relkind <> 'i'", [name]).fetchone()
+    return row[0] if row else None
+
+
+#-----------------------------------------------------------------------------
+# To get the table and columns an index or key of <table_name> is built on,
+# the compact table when <table_name> is stored compact (see compact_tables)
+#   views: names of the views in the database
+#   freeze_frame_json: False -> events has no _freeze_frame column
+#-----------------------------------------------------------------------------
+def get_storage_columns(table_name, columns, views, freeze_frame_json = True):
+    if table_name not in views or table_name not in compact_tables:
+        return (table_name, columns)
+    (compact_table, get_compact_columns) = compact_tables[table_name]
+    compact_columns = get_compact_columns(freeze_frame_json)
+    return (compact_table, [c for column in columns for c in compact_columns[column]])
+
+
+#-----------------------------------------------------------------------------
+# To get the table a foreign key references, 'table' or 'table(column)',
+# the compact table when the table is stored compact (see compact_tables)
+#   views: names of the views in the database
+#-----------------------------------------------------------------------------
+def get_storage_table(ref_table, views):
+    table_name = ref_table.split('(')[0]
+    if table_name not in views or table_name not in compact_tables:
+        return ref_table
+    return compact_tables[table_name][0] + ref_table[len(table_name):]
 
 
+#-----------------------------------------------------------------------------
+# To build the indexes and keys once all the data is loaded and committed
+#   1. the indexes in db_indexes and db_gist_indexes and the unique indexes
+#      of the primary keys are built at the same time, each on a connection
+#      of its own
+#   2. the primary keys are added on their unique index and the foreign
+#      keys are added NOT VALID, which does not read the tables
+#   3. the foreign keys are validated at the same time, each on a
+#      connection of its own
+# the time taken by each index and key is reported
+# postgres cannot add a primary key on an existing index nor a NOT VALID
+# foreign key to a partitioned table, so for partitioned tables the primary
+# key (with the partition keys, see partition_keys) is added in step 1 and
+# the foreign keys are added and validated at once in step 3
+# the indexes and keys of a table stored compact are built on its compact
+# table, see compact_events()
+# a partitioned table has no unique key on its primary key columns alone,
+# so the foreign keys referencing it are left out
+#   conn =  connection to the database
+#   workers = number of connections used at the same time, at most
+#             <max_workers>: the peak memory of the builds is about
+#             workers x maintenance_work_mem
+#   freeze_frame_json = False: events has no _freeze_frame column
+#   maintenance_work_mem = memory for each index build / validation
+#   parallel_workers = max_parallel_maintenance_workers of each build
+#-----------------------------------------------------------------------------
+def finalize_db(conn, workers = 1, freeze_frame_json = True, maintenance_work_mem = '256MB', parallel_workers = 2,
+                max_workers = 4):
     conn.commit()
-    print("All data successfully loaded.")
+    workers = max(1, min(workers or 1, max_workers))
+    conninfo = make_conninfo(**conn.info.get_parameters(), password = conn.info.password)
+    settings = [f"SET maintenance_work_mem = '{maintenance_work_mem}'",
+                f"SET max_parallel_maintenance_workers = {parallel_workers}"]
+    partitioned = [r[0] for r in conn.execute("SELECT relname FROM pg_class WHERE relkind = 'p' AND NOT relispartition")]
+    views = [r[0] for r in conn.execute("SELECT relname FROM pg_class WHERE relkind = 'v'")]
+    primary_keys = [(*get_storage_columns(t, columns, views, freeze_frame_json), name) for (t, name, columns) in db_primary_keys]
+    indexes = [(*get_storage_columns(t, columns, views, freeze_frame_json), name) for (name, t, columns) in db_indexes]
+    gist_indexes = [(*get_storage_columns(t, columns, views, freeze_frame_json), name)
+                    for (name, t, columns) in db_gist_indexes]
+    foreign_keys = [(*get_storage_columns(t, [column], views, freeze_frame_json), name, get_storage_table(ref_table, views))
+                    for (t, name, column, ref_table) in db_foreign_keys
+                    if ref_table.split('(')[0] not in partitioned]
+    start = time.perf_counter()
+
+    jobs = []
+    for (table_name, columns, name) in primary_keys:
+        if table_name in partitioned:
+            columns = columns + partition_keys[table_name]
+            jobs.append((name, f'ALTER TABLE {table_name} ADD CONSTRAINT {name} PRIMARY KEY ({",".join(columns)})'))
+        else:
+            jobs.append((name, f'CREATE UNIQUE INDEX {name} ON {table_name}({",".join(columns)})'))
+    jobs += [(name, f'CREATE INDEX {name} ON {table_name}({",".join(columns)})') for (table_name, columns, name) in indexes]
+    jobs += [(name, f'CREATE INDEX {name} ON {table_name} USING gist ({",".join(columns)})')
+             for (table_name, columns, name) in gist_indexes]
+    print(f'----- building {len(jobs)} indexes with {workers} connections...')
+    run_timed_parallel(conninfo, jobs, settings, workers)
+
+    print('----- adding primary and foreign keys...')
+    for (table_name, columns, name) in primary_keys:
+        if table_name not in partitioned:
+            conn.execute(f'ALTER TABLE {table_name} ADD CONSTRAINT {name} PRIMARY KEY USING INDEX {name}')
+    for (table_name, [column], name, ref_table) in foreign_keys:
+        if table_name not in partitioned:
+            conn.execute(f'ALTER TABLE {table_name} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {ref_table} NOT VALID')
+    conn.commit()
+
+    print(f'----- validating {len(foreign_keys)} foreign keys with {workers} connections...')
+    jobs = []
+    for (table_name, [column], name, ref_table) in foreign_keys:
+        if table_name in partitioned:
+            jobs.append((name, f'ALTER TABLE {table_name} ADD CONSTRAINT {name} FOREIGN KEY ({column}) REFERENCES {ref_table}'))
+        else:
+            jobs.append((name, f'ALTER TABLE {table_name} VALIDATE CONSTRAINT {name}'))
+    run_timed_parallel(conninfo, jobs, settings, workers)
+
+    print(f'      indexes and keys built in {time.perf_counter() - start:.2f}s')
 
 
 #-----------------------------------------------------------------------------
-# To extract data from sb_events and load to table events
+# To run the (name, sql) jobs with <workers> connections at the same time
+# and print the time taken by each of them as they complete
+#   conninfo: connection string of the database
+#   settings: statements run on each connection before its job
+#-----------------------------------------------------------------------------
+def run_timed_parallel(conninfo, jobs, settings, workers):
+    with ThreadPoolExecutor(max_workers = max(1, min(workers, len(jobs)))) as executor:
+        futures = [executor.submit(run_timed, conninfo, name, str, settings) for (name, str) in jobs]
+        # raises the first error from the connections, if any
+        for future in as_completed(futures):
+            (name, seconds) = future.result()
+            print(f'      {name}: {seconds:.2f}s')
+
+
+#-----------------------------------------------------------------------------
+# To run one statement on a connection of its own, returns (name, seconds)
+#-----------------------------------------------------------------------------
+def run_timed(conninfo, name, str, settings):
+    with psycopg.connect(conninfo, autocommit = True) as conn:
+        for setting in settings:
+            conn.execute(setting)
+        start = time.perf_counter()
+        conn.execute(str)
+        return (name, time.perf_counter() - start)
+
+
+#-----------------------------------------------------------------------------
+# To compute the fingerprint of each match of the combined files, returns
+# {match_id: sha256}. It changes when the match record, its lineups or its
+# events change. The sha256 of the lineups and events files are taken from
+# the sb_combine manifests (written by every sb_combine.combine_files()),
+# so only sb_matches is read. Without a manifest matching the combined file
+# (see sb_combine.load_manifest()) the records are hashed
+#-----------------------------------------------------------------------------
+def get_match_fingerprints():
+    hashes = {}
+    for name in ('sb_matches', 'sb_lineups', 'sb_events'):
+        file_path = get_sb_file_path(name)
+        file_format = get_file_format(file_path)
+        manifest = sb_combine.load_manifest(file_path, file_format) if name != 'sb_matches' else None
+
+        if manifest is not None:
+            for (path, entry) in manifest.items():
+                match_id = int(os.path.basename(path).replace('.json', ''))
+                hashes.setdefault(match_id, {})[name] = entry['sha256']
+        else:
+            h = {}
+            for d in sb_combine.read_combined_file(file_path, file_format):
+                match_id = get_record_match_id(d)
+                h.setdefault(match_id, hashlib.sha256()).update(json.dumps(d, sort_keys = True).encode())
+            for (match_id, m) in h.items():
+                hashes.setdefault(match_id, {})[name] = m.hexdigest()
+
+    # only the matches found in sb_matches are loaded
+    return {match_id: hashlib.sha256('|'.join(h.get(name, '') for name in ('sb_matches', 'sb_lineups', 'sb_events'))
+                                     .encode()).hexdigest()
+            for (match_id, h) in hashes.items() if 'sb_matches' in h}
+
+
+#-----------------------------------------------------------------------------
+# To record the fingerprints of the loaded matches in loaded_matches
+#-----------------------------------------------------------------------------
+def save_loaded_matches(conn, fingerprints):
+    with conn.cursor() as cur:
+        cur.executemany('''INSERT INTO loaded_matches (match_id, fingerprint) VALUES (%s, %s)
+                           ON CONFLICT (match_id) DO UPDATE SET fingerprint = EXCLUDED.fingerprint, loaded_at = now()''',
+                        list(fingerprints.items()))
+
+
+#-----------------------------------------------------------------------------
+# To load only the new or changed matches of the combined files into a
+# database built by a full load (see main()). The matches are found by
+# comparing get_match_fingerprints() with loaded_matches, only their data
+# goes through the sb tables and their rows are replaced by reload_matches()
 #   conn =  connection to the database
+#   batch_size, workers, bulk = see import_sbdata()
 #-----------------------------------------------------------------------------
-def load_event_data(conn):
-
-    db_fields = [
-    ['50_50','_outcome','_counterpress']
-    ,['bad_behaviour','_card']
-    ,['ball_receipt','_outcome']
-    ,['ball_recovery','_offensive','_recovery_failure']
-    ,['block','_counterpress','_deflection','_offensive','_save_block']
-    ,['carry','_end_location']
-    ,['clearance','_aerial_won','_body_part']
-    ,['dribble','_outcome','_nutmeg','_overrun','_no_touch']
-    ,['dribbled_past','_counterpress']
-    ,['duel','_counterpress','_type','_outcome']
-    ,['foul_committed','_advantage','_counterpress','_offensive','_penalty','_card','_type']
-    ,['foul_won','_advantage','_defensive','_penalty']
-    ,['goalkeeper','_position','_technique','_body_part','_type','_outcome']
-    ,['half_end','_early_video_end','_match_suspended']
-    ,['half_start','_late_video_start']
-    ,['injury_stoppage','_in_chain']
-    ,['interception','_outcome']
-    ,['miscontrol','_aerial_won']
-    ,['pass','_recipient_id','_length','_angle','_height','_end_location','_assisted_shot_id','_backheel','_deflected','_miscommunication','_cross','_cut_back','_switch','_shot_assist','_goal_assist','_body_part','_type','_outcome','_technique']
-    ,['player_off','_permanent']
-    ,['pressure','_counterpress']
-    ,['shot','_key_pass_id','_end_location','_aerial_won','_follows_dribble','_first_time','_freeze_frame','_open_goal','_statsbomb_xg','_deflected','_technique','_body_part','_type','_outcome']
-    ,['substitution','_replacement_id','_outcome']
-    ]
-
-    sb_childs = [
-    ["50_50","(data->'50_50'->'outcome'->>'name')","(data->'50_50'->>'counterpress')::boolean"]
-    ,["bad_behaviour","(data->'bad_behaviour'->'card'->>'name')"]
-    ,["ball_receipt","(data->'ball_receipt'->'outcome'->>'name')"]
-    ,["ball_recovery","(data->'ball_recovery'->>'offensive')::boolean","(data->'ball_recovery'->>'recovery_failure')::boolean"]
-    ,["block","(data->'block'->>'counterpress')::boolean","(data->'block'->>'deflection')::boolean","(data->'block'->>'offensive')::boolean","(data->'block'->>'save_block')::boolean"]
-    ,["carry","(ARRAY[(data->'carry'->'end_location')[0],(data->'carry'->'end_location')[1]])::decimal []"]
-    ,["clearance","(data->'clearance'->>'aerial_won')::boolean","(data->'clearance'->'body_part'->>'name')"]
-    ,["dribble","(data->'dribble'->'outcome'->>'name')","(data->'dribble'->>'nutmeg')::boolean","(data->'dribble'->>'overrun')::boolean","(data->'dribble'->>'no_touch')::boolean"]
-    ,["dribbled_past","(data->'dribbled_past'->>'counterpress')::boolean"]
-    ,["duel","(data->'duel'->>'counterpress')::boolean","(data->'duel'->'type'->>'name')","(data->'duel'->'outcome'->>'name')"]
-    ,["foul_committed","(data->'foul_committed'->>'advantage')::boolean","(data->'foul_committed'->>'counterpress')::boolean","(data->'foul_committed'->>'offensive')::boolean","(data->'foul_committed'->>'penalty')::boolean","(data->'foul_committed'->'card'->>'name')","(data->'foul_committed'->'type'->>'name')"]
-    ,["foul_won","(data->'foul_won'->>'advantage')::boolean","(data->'foul_won'->>'defensive')::boolean","(data->'foul_won'->>'penalty')::boolean"]
-    ,["goalkeeper","(data->'goalkeeper'->'position'->>'name')","(data->'goalkeeper'->'technique'->>'name')","(data->'goalkeeper'->'body_part'->>'name')","(data->'goalkeeper'->'type'->>'name')","(data->'goalkeeper'->'outcome'->>'name')"]
-    ,["half_end","(data->'half_end'->>'early_video_end')::boolean","(data->'half_end'->>'match_suspended')::boolean"]
-    ,["half_start","(data->'half_start'->>'late_video_start')::boolean"]
-    ,["injury_stoppage","(data->'injury_stoppage'->>'in_chain')::boolean"]
-    ,["interception","(data->'interception'->'outcome'->>'name')"]
-    ,["miscontrol","(data->'miscontrol'->>'aerial_won')::boolean"]
-    ,["pass","(data->'pass'->'recipient'->>'id')::integer","(data->'pass'->>'length')::decimal","(data->'pass'->>'angle')::decimal","(data->'pass'->'height'->>'name')",
-    "(ARRAY[(data->'pass'->'end_location')[0],(data->'pass'->'end_location')[1]])::decimal []",
-    "(data->'pass'->>'assisted_shot_id')::uuid","(data->'pass'->>'backheel')::boolean","(data->'pass'->>'deflected')::boolean","(data->'pass'->>'miscommunication')::boolean","(data->'pass'->>'cross')::boolean","(data->'pass'->>'cut_back')::boolean","(data->'pass'->>'switch')::boolean","(data->'pass'->>'shot_assist')::boolean","(data->'pass'->>'goal_assist')::boolean","(data->'pass'->'body_part'->>'name')","(data->'pass'->'type'->>'name')","(data->'pass'->'outcome'->>'name')","(data->'pass'->'technique'->>'name')"]
-    ,["player_off","(data->'player_off'->>'permanent')::boolean"]
-    ,["pressure","(data->'pressure'->>'counterpress')::boolean"]
-    ,["shot","(data->'shot'->>'key_pass_id')::uuid",
-        '''CASE (data->'shot'->'end_location')[2]
-                WHEN  NULL THEN 
-                    ARRAY[(data->'shot'->'end_location')[0],(data->'shot'->'end_location')[1]]
-                ELSE
-                    ARRAY[(data->'shot'->'end_location')[0],(data->'shot'->'end_location')[1],(data->'shot'->'end_location')[2]]
-            END :: decimal[] ''',
-        "(data->'shot'->>'aerial_won')::boolean","(data->'shot'->>'follows_dribble')::boolean","(data->'shot'->>'first_time')::boolean","(data->'shot'->'freeze_frame')","(data->'shot'->>'open_goal')::boolean","(data->'shot'->>'statsbomb_xg')::decimal","(data->'shot'->>'deflected')::boolean","(data->'shot'->'technique'->>'name')","(data->'shot'->'body_part'->>'name')","(data->'shot'->'type'->>'name')","(data->'shot'->'outcome'->>'name')"]
-    ,["substitution","(data->'substitution'->'replacement'->>'id')::integer","(data->'substitution'->'outcome'->>'name')"]
-    ]
-
-    str_events = '''
-        CREATE TABLE events AS 
-        SELECT 
-            tmp_event_main.event_id
-            , index
-            , period
-            , timestamp
-            , minute
-            , second
-            , type
-            , possession
-            , possession_team_id
-            , play_pattern
-            , team_id
-            , player_id
-            , position
-            , location
-            , duration
-            , under_pressure
-            , off_camera
-            , out
-            , match_id
-            , _advantage
-            , _aerial_won
-            , _angle
-            , _assisted_shot_id
-            , _backheel
-            , _body_part
-            , _card
-            , _counterpress
-            , _cross
-            , _cut_back
-            , _defensive
-            , _deflected
-            , _deflection
-            , _early_video_end
-            , _end_location
-            , _first_time
-            , _follows_dribble
-            , _freeze_frame
-            , _goal_assist
-            , _height
-            , _in_chain
-            , _key_pass_id
-            , _late_video_start
-            , _length
-            , _match_suspended
-            , _miscommunication
-            , _no_touch
-            , _nutmeg
-            , _offensive
-            , _open_goal
-            , _outcome
-            , _overrun
-            , _penalty
-            , _permanent
-            , _position
-            , _recipient_id
-            , _recovery_failure
-            , _replacement_id
-            , _save_block
-            , _shot_assist
-            , _statsbomb_xg
-            , _switch
-            , _technique
-            , _type
-        FROM tmp_event_main
-        NATURAL LEFT JOIN tmp_event_data
-    '''
+def update_sbdata(conn, batch_size = 1000, workers = 1, bulk = False):
+    if get_relkind(conn, 'events') == 'v':
+        raise ValueError('events is stored compact, load it again with main(compact=True)')
+
+    fingerprints = get_match_fingerprints()
+    loaded = dict(conn.execute('SELECT match_id, fingerprint FROM loaded_matches').fetchall())
+    match_ids = sorted(m for (m, f) in fingerprints.items() if loaded.get(m) != f)
+    print(f'----- {len(match_ids)} new or changed matches out of {len(fingerprints)}')
+    if len(match_ids) == 0:
+        return
+
+    import_sbdata(conn, batch_size, workers, bulk, match_ids = set(match_ids))
+    reload_matches(conn, match_ids)
+    save_loaded_matches(conn, {m: fingerprints[m] for m in match_ids})
+    conn.commit()
+    print("All data successfully loaded.")
 
-    # populate table event_data_wide
-    for i in range(len(sb_childs)):
-        print(f'----- loading data for {sb_childs[i][0]}...')
-
-        si = "INSERT INTO tmp_event_data (event_id"
-        sq = "SELECT (data->>'id')::uuid" 
-        # print(s)
-        for j in range(len(sb_childs[i])-1):
-            sq = sq + "," + sb_childs[i][j+1] 
-            si = si + "," + db_fields[i][j+1]
-            
-        sq = "(" + sq + f" FROM sb_events WHERE data->'{sb_childs[i][0]}' IS NOT NULL)"  
-        si = si + ") "
-        str = si + sq 
 
-        print(f'      {conn.execute(str).rowcount} records loaded')
+#-----------------------------------------------------------------------------
+# To replace the rows of the matches <match_ids> with the content of the sb
+# tables, in the transaction of <conn> (not committed here)
+#   1. the events, event_related, event_tactics, event_freeze_frames, players
+#      and managers rows of the matches are deleted
+#   2. the reference data is upserted (ON CONFLICT), matches are updated
+#   3. the rows of the matches are inserted again, their seasons are
+#      refreshed in the season aggregates (sb_stats) and their possessions
+#      in possessions (sb_possessions)
+# the indexes and keys of the tables are kept as they are, the _freeze_frame
+# column is loaded if events has it
+#   conn =  connection to the database
+#-----------------------------------------------------------------------------
+def reload_matches(conn, match_ids):
+    fields = sb_fields.get_event_fields(has_freeze_frame_json(conn))
+    print('----- deleting the rows of the matches...')
+    delete_event_rows(conn, match_ids)
+    for table_name in ('events', 'players', 'managers'):
+        print(f'      {table_name}: {conn.execute(f"DELETE FROM {table_name} WHERE match_id = ANY(%s)", [match_ids]).rowcount}')
+
+    load_match_data(conn, upsert = True)
 
-    # combine tmp_event_main and tmp_event_data into table events for analysis purposes
     print('----- populating table events...')
-    print(f'      {conn.execute(str_events).rowcount} records loaded')
-
-    print('----- building primary and foreign keys...')
-    conn.execute(''' 
-                ALTER TABLE events ADD PRIMARY KEY (event_id)
-                , ADD FOREIGN KEY (match_id) REFERENCES matches
-                , ADD FOREIGN KEY (team_id) REFERENCES teams
-                , ADD FOREIGN KEY (possession_team_id) REFERENCES teams
-                , ADD FOREIGN KEY (player_id) REFERENCES persons
-                , ADD FOREIGN KEY (_recipient_id) REFERENCES persons
-                , ADD FOREIGN KEY (_replacement_id) REFERENCES persons
-                '''
-    )
-
-    print('----- creating index on events...')
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_type ON events(type)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_player ON events(player_id)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_team ON events(team_id)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_recipient ON events(_recipient_id)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_first_time ON events(_first_time)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_technique ON events(_technique)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_outcome ON events(_outcome)")
-    conn.execute("CREATE INDEX IF NOT EXISTS idx_events_end_location ON events(_end_location)")
-
-   
+    if get_relkind(conn, 'events') == 'p':
+        create_event_partitions(conn)
+        str = fields.get_partitioned_insert()
+    else:
+        str = fields.events_single_pass_insert
+    print(f'      {conn.execute(str).rowcount} records loaded')
+
+    insert_event_rows(conn)
+
+    sb_stats.refresh_season_stats(conn, match_ids)
+    sb_possessions.refresh_possessions(conn, match_ids)
+
+
+#-----------------------------------------------------------------------------
+# To delete the rows of event_child_tables of the events of <match_ids>,
+# events must still hold these events
+#   conn =  connection to the database
+#-----------------------------------------------------------------------------
+def delete_event_rows(conn, match_ids):
+    event_ids = 'SELECT event_id FROM events WHERE match_id = ANY(%s)'
+    for (table_name, select) in event_child_tables:
+        conn.execute(f'DELETE FROM {table_name} WHERE event_id IN ({event_ids})', [match_ids])
+
+
+#-----------------------------------------------------------------------------
+# To insert the rows of event_child_tables from sb_events
+#   conn =  connection to the database
+#   match_ids = None -> every event of sb_events
+#               list of match ids -> the events of these matches only
+#-----------------------------------------------------------------------------
+def insert_event_rows(conn, match_ids = None):
+    for (table_name, select) in event_child_tables:
+        print(f'----- populating table {table_name}...')
+        if match_ids is None:
+            str = f'INSERT INTO {table_name} ' + select
+            params = []
+        else:
+            str = (f'INSERT INTO {table_name} SELECT * FROM ({select}) s '
+                   'WHERE s.event_id IN (SELECT event_id FROM sb_events WHERE match_id = ANY(%s))')
+            params = [match_ids]
+        print(f'      {conn.execute(str, params).rowcount} records loaded')
+
+
+#-----------------------------------------------------------------------------
+# To apply session settings suited to bulk loading on <conn>
+#   synchronous_commit off: commits do not wait for the WAL flush, a crash
+#   can lose the last commits but never corrupts the database
+#   work_mem: memory for the sorts and hashes of the INSERT ... SELECT steps
+#-----------------------------------------------------------------------------
+def set_bulk_session(conn, work_mem = '256MB'):
+    conn.execute('SET synchronous_commit = off')
+    conn.execute(f"SET work_mem = '{work_mem}'")
+
+
+#-----------------------------------------------------------------------------
+# To refresh the planner statistics of <tables>
+#-----------------------------------------------------------------------------
+def analyze_tables(conn, tables):
+    for table_name in tables:
+        conn.execute(f'ANALYZE {table_name}')
+
+
+#-----------------------------------------------------------------------------
+# To drop the staging tables (staging_tables) once the data is parsed
+#-----------------------------------------------------------------------------
+def drop_staging(conn):
+    print('----- dropping staging tables...')
+    for table_name in staging_tables:
+        conn.execute(f'DROP TABLE IF EXISTS {table_name}')
+    conn.commit()
+
+
 #-------------------------------------------
 # main
+#   bulk = load through UNLOGGED staging tables with the bulk session
+#          settings, the staging tables are dropped at the end
+#   partitioned = build events partitioned by competition and season
+#   incremental = only load the new or changed matches into the existing
+#                 tables, see update_sbdata()
+#   compact = store events dictionary encoded behind an events view,
+#             see compact_events()
+#   freeze_frame_json = False: leave the _freeze_frame column out of events,
+#                       an incremental load follows the loaded events
 #-------------------------------------------
-def main():
-    # Define your PostgreSQL database connection details
+def main(workers = os.cpu_count(), bulk = True, partitioned = False, incremental = False, compact = False,
+         freeze_frame_json = True):
+    # PostgreSQL database connection details, see db_settings
     try:
-        conn = psycopg.connect(
-            # dbname="statsbomb",
-            dbname="3005",
-            user="postgres",
-            password="8023",
-            host="localhost",
-            port=5432
-        )
+        conn = connect()
 
         # load_event_data(conn)
 
+        if bulk:
+            set_bulk_session(conn)
+
+        if incremental:
+            print('Load new or changed matches')
+            update_sbdata(conn, workers=workers, bulk=bulk)
+            if bulk:
+                drop_staging(conn)
+            return
+
+        fingerprints = get_match_fingerprints()
+
         print('Import json data into sb tables')
-        import_sbdata(conn)
+        import_sbdata(conn, workers=workers, bulk=bulk)
 
         print('Create table schema to hold data from the sb tables')
-        create_db_schema(conn)
+        create_db_schema(conn, unlogged=bulk, freeze_frame_json=freeze_frame_json)
 
         print('Parse json data and populate the database')
-        parse_sbdata(conn)
+        parse_sbdata(conn, single_pass=True, workers=workers, partitioned=partitioned, compact=compact,
+                     freeze_frame_json=freeze_frame_json)
+        save_loaded_matches(conn, fingerprints)
+
+        if bulk:
+            drop_staging(conn)
 
     except Exception as e:
         # print(f"Error: {e}")
@@ -0,0 +1,109 @@
+'''
+----------------------------------------------------------------------------------------
+Possessions of the events table
+
+Every event carries its match_id, possession, possession_team_id and index. The
+possessions table holds one row per (match_id, possession) with the numbers a
+possession level analysis needs, so they are lookups instead of window functions
+over events:
+
+    start / end index and timestamp, duration (seconds), team, number of events,
+    passes and shots, type of the last event and total xG
+
+e.g. the average xG per possession of the teams of the La Liga 2020/2021 season:
+
+    SELECT teams.team_name, avg(xg)
+    FROM possessions
+        JOIN teams ON possessions.team_id = teams.team_id
+    WHERE competition_id = 11 AND season_id = 90
+    GROUP BY 1
+
+The table is built by sb_loader once events is loaded, in one pass over events
+ordered by match and possession. refresh_possessions() recomputes the given matches
+only, so loading new matches does not rebuild the whole table
+----------------------------------------------------------------------------------------
+'''
+
+
+# -------------------------------------------------------------------------
+# DDL of the possessions table
+# -------------------------------------------------------------------------
+possessions_ddl = '''
+    CREATE TABLE IF NOT EXISTS possessions
+    ( match_id          integer     not null
+    , possession        integer     not null
+    , competition_id    integer     not null
+    , season_id         integer     not null
+    , team_id           integer
+    , period            integer
+    , start_index       integer     not null
+    , end_index         integer     not null
+    , start_timestamp   time
+    , end_timestamp     time
+    , duration          decimal
+    , events            integer     not null
+    , passes            integer     not null
+    , shots             integer     not null
+    , end_type          varchar(32)
+    , xg                decimal     not null
+    , primary key (match_id, possession)
+    );
+'''
+
+# indexes of the possessions table (name, columns)
+possessions_indexes = [
+    ('idx_possessions_team', 'team_id'),
+    ('idx_possessions_season', 'competition_id, season_id, team_id'),
+]
+
+
+# -------------------------------------------------------------------------
+# to get the INSERT aggregating events into possessions
+#   where: condition on events / matches restricting the matches aggregated
+# -------------------------------------------------------------------------
+def get_possessions_insert(where = ''):
+    return ('INSERT INTO possessions (match_id,possession,competition_id,season_id,team_id,period,'
+            'start_index,end_index,start_timestamp,end_timestamp,duration,events,passes,shots,end_type,xg) '
+            'SELECT events.match_id,events.possession,matches.competition_id,matches.season_id,'
+            '(array_agg(events.possession_team_id ORDER BY events.index))[1],'
+            'min(events.period),min(events.index),max(events.index),'
+            'min(events.timestamp),max(events.timestamp),'
+            'extract(epoch FROM max(events.timestamp) - min(events.timestamp)),'
+            "count(*),count(*) FILTER (WHERE events.type = 'Pass'),count(*) FILTER (WHERE events.type = 'Shot'),"
+            '(array_agg(events.type ORDER BY events.index DESC))[1],'
+            'coalesce(sum(events._statsbomb_xg), 0) '
+            'FROM events JOIN matches ON matches.match_id = events.match_id '
+            'WHERE events.possession IS NOT NULL'
+            + (f' AND {where}' if where else '')
+            + ' GROUP BY events.match_id,events.possession,matches.competition_id,matches.season_id')
+
+
+# -------------------------------------------------------------------------
+# to create the possessions table, an existing one is dropped
+#   conn: connection to the database
+# -------------------------------------------------------------------------
+def create_possessions_table(conn):
+    print('----- creating table possessions...')
+    conn.execute('DROP TABLE IF EXISTS possessions')
+    conn.execute(possessions_ddl)
+    for (index_name, columns) in possessions_indexes:
+        conn.execute(f'CREATE INDEX {index_name} ON possessions({columns})')
+
+
+# -------------------------------------------------------------------------
+# to (re)compute the possessions table
+#   conn: connection to the database
+#   match_ids: None -> every match is recomputed
+#              list of match ids -> only these matches are recomputed
+# -------------------------------------------------------------------------
+def refresh_possessions(conn, match_ids = None):
+    print('----- refreshing table possessions...')
+    if match_ids is None:
+        conn.execute('TRUNCATE possessions')
+        str = get_possessions_insert()
+        params = []
+    else:
+        conn.execute('DELETE FROM possessions WHERE match_id = ANY(%s)', [list(match_ids)])
+        str = get_possessions_insert('events.match_id = ANY(%s)')
+        params = [list(match_ids)]
+    print(f'      {conn.execute(str, params).rowcount} records loaded')
@@ -0,0 +1,170 @@
+'''
+----------------------------------------------------------------------------------------
+Provisioning of the query database from a template database
+
+Each Q_n method of queries.py calls load_database(), which drops query_database and
+restores dbexport.sql into a new one with psql: ten full restores per run.
+
+This module restores dbexport.sql once into a template database and provides a
+load_database() creating query_database as a copy of the template
+(CREATE DATABASE ... TEMPLATE, a copy of the database files), so each Q_n starts from
+the same freshly restored database in about a second:
+
+    1. create_template_database(): restores dbexport.sql into <query_database>_template
+       and marks it as a template. The sha256 of dbexport.sql is kept as the comment
+       of the template, the restore is skipped while the file is unchanged
+    2. load_database(): drops query_database and copies the template
+
+main() runs the Q_n methods of queries.py with this load_database(). queries.py is not
+modified, its load_database is only replaced while main() runs. The connection
+settings are the ones of queries.py
+
+By default the template is a plain restore, so the plans and timings of the queries
+are the ones of queries.load_database(). With vacuum=True the template is vacuumed
+and analyzed once: the copies start with statistics and a set visibility map, and
+the plans and timings differ from a plain restore
+----------------------------------------------------------------------------------------
+'''
+
+import psycopg
+import hashlib
+import os
+import subprocess
+import sys
+import time
+import traceback
+
+queries_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, queries_dir)
+import queries
+
+template_database_name = queries.query_database_name + '_template'
+dump_path = os.path.join(queries_dir, 'dbexport.sql')
+
+
+#-----------------------------------------------------------------------
+# To connect to a database with the connection settings of queries.py
+#-----------------------------------------------------------------------
+def connect(dbname):
+    return psycopg.connect(dbname=dbname, user=queries.db_username, password=queries.db_password,
+                           host=queries.db_host, port=queries.db_port)
+
+
+#-----------------------------------------------------------------------
+# To compute the sha256 of a file
+#-----------------------------------------------------------------------
+def get_file_fingerprint(file_path):
+    h = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+#-----------------------------------------------------------------------
+# To get the comment of a database (the fingerprint of the dump restored
+# into the template), None if the database does not exist
+#-----------------------------------------------------------------------
+def get_database_comment(conn, dbname):
+    str = "SELECT coalesce(shobj_description(oid, 'pg_database'), '') FROM pg_database WHERE datname = %s"
+    row = conn.execute(str, [dbname]).fetchone()
+    return row[0] if row else None
+
+
+#-----------------------------------------------------------------------
+# To restore <file_path> into the template database, unless the template
+# already holds this version of the file
+#   conn: connection to the root database
+#   force: restore even if the file is unchanged
+#   vacuum: VACUUM ANALYZE the template after the restore (the template is
+#           then not a plain restore, see above)
+#-----------------------------------------------------------------------
+def create_template_database(conn, file_path = dump_path, force = False, vacuum = False):
+    fingerprint = get_file_fingerprint(file_path)
+    comment = get_database_comment(conn, template_database_name)
+    conn.commit()
+    if comment == fingerprint and not force:
+        print(f'----- {template_database_name} is up to date with {file_path}')
+        return
+
+    conn.autocommit = True
+    try:
+        if comment is not None:
+            print(f'----- dropping {template_database_name}...')
+            conn.execute(f'ALTER DATABASE {template_database_name} WITH IS_TEMPLATE false')
+            conn.execute(f'DROP DATABASE {template_database_name}')
+        conn.execute(f'CREATE DATABASE {template_database_name}')
+
+        print(f'----- restoring {file_path} into {template_database_name}...')
+        start = time.perf_counter()
+        command = (f'psql -h {queries.db_host} -U {queries.db_username} -d {template_database_name} '
+                   f'-q -f "{file_path}" > /dev/null 2>&1')
+        env = {**os.environ, 'PGPASSWORD': queries.db_password}
+        subprocess.run(command, shell=True, check=True, env=env)
+
+        # statistics and visibility map are copied with the template
+        if vacuum:
+            with connect(template_database_name) as template_conn:
+                template_conn.autocommit = True
+                template_conn.execute('VACUUM ANALYZE')
+        print(f'      restored in {time.perf_counter() - start:.2f}s')
+
+        # no connection to the template, CREATE DATABASE ... TEMPLATE needs none
+        conn.execute(f"COMMENT ON DATABASE {template_database_name} IS '{fingerprint}'")
+        conn.execute(f'ALTER DATABASE {template_database_name} WITH IS_TEMPLATE true ALLOW_CONNECTIONS false')
+
+    finally:
+        conn.autocommit = False
+
+
+#-----------------------------------------------------------------------
+# To create query_database as a copy of the template database, returns a
+# connection to query_database. Same use as queries.load_database()
+#   conn: connection to the root database, closed here
+#-----------------------------------------------------------------------
+def load_database(conn):
+    queries.drop_database(conn)
+
+    # file level copy of the template (postgres 15 defaults to WAL_LOG,
+    # which writes the whole database to the WAL)
+    strategy = ' STRATEGY FILE_COPY' if conn.info.server_version >= 150000 else ''
+    conn.autocommit = True
+    try:
+        conn.execute(f'CREATE DATABASE {queries.query_database_name} TEMPLATE {template_database_name}{strategy}')
+    finally:
+        conn.autocommit = False
+    conn.close()
+
+    return connect(queries.query_database_name)
+
+
+#-------------------------------------------
+# main
+#   file_path = dump restored into the template
+#   force = restore the template even if the dump is unchanged
+#   vacuum = VACUUM ANALYZE the template, see create_template_database()
+#-------------------------------------------
+def main(file_path = dump_path, force = False, vacuum = False):
+    conn = None
+    try:
+        conn = connect(queries.root_database_name)
+        create_template_database(conn, file_path, force, vacuum)
+
+        print('----- running the queries...')
+        default_load_database = queries.load_database
+        queries.load_database = load_database
+        try:
+            queries.run_queries(conn)
+        finally:
+            queries.load_database = default_load_database
+
+    except Exception as e:
+        print(traceback.format_exc())
+
+    finally:
+        if conn is not None:
+            conn.close()
+#-----------------------------------------------------
+
+if __name__ == '__main__':
+    main()
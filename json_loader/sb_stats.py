@@ -0,0 +1,111 @@
+'''
+----------------------------------------------------------------------------------------
+Season aggregates of the events table
+
+The analysis queries count events (shots, passes, through balls, dribbles...) and
+average xG per player or team for a competition and season. The tables described
+in stats_tables hold these numbers pre-aggregated, one row per
+
+    (competition_id, season_id, <player or team>, type, _technique, _outcome, _first_time)
+
+with the number of events, the number of events with an xG and the xG sum, e.g.
+the average xG of the La Liga 2020/2021 shooters:
+
+    SELECT persons.name, sum(xg_sum) / sum(xg_events)
+    FROM player_season_stats
+        JOIN persons ON player_season_stats.player_id = persons.id
+    WHERE type = 'Shot' AND competition_id = 11 AND season_id = 90
+    GROUP BY 1
+
+The tables are built by sb_loader once events is loaded. refresh_season_stats()
+recomputes the seasons of the given matches only, so loading new matches does not
+rebuild the whole tables
+----------------------------------------------------------------------------------------
+'''
+
+
+# -------------------------------------------------------------------------
+# (table, events column the rows are grouped by, column name in the table)
+# -------------------------------------------------------------------------
+stats_tables = [
+    ('player_season_stats',     'player_id',        'player_id'),
+    ('recipient_season_stats',  '_recipient_id',    'player_id'),
+    ('team_season_stats',       'team_id',          'team_id'),
+]
+
+# events columns splitting an event type into subtypes (column, sql type)
+stats_subtypes = [
+    ('_technique',  'varchar(32)'),
+    ('_outcome',    'varchar(32)'),
+    ('_first_time', 'boolean'),
+]
+
+
+# -------------------------------------------------------------------------
+# to get the DDL of a stats table
+# -------------------------------------------------------------------------
+def get_stats_ddl(table_name, column):
+    return (f'CREATE TABLE IF NOT EXISTS {table_name}\n'
+            + '( competition_id integer not null\n'
+            + ', season_id integer not null\n'
+            + f', {column} integer not null\n'
+            + ', type varchar(32) not null\n'
+            + ''.join(f', {c} {t}\n' for (c, t) in stats_subtypes)
+            + ', events bigint not null\n'
+            + ', xg_events bigint not null\n'
+            + ', xg_sum decimal\n'
+            + ');')
+
+
+# -------------------------------------------------------------------------
+# to get the INSERT aggregating events into a stats table
+#   where: condition on matches restricting the seasons aggregated
+# -------------------------------------------------------------------------
+def get_stats_insert(table_name, event_column, column, where = ''):
+    subtypes = ','.join(c for (c, t) in stats_subtypes)
+    return (f'INSERT INTO {table_name} (competition_id,season_id,{column},type,{subtypes},events,xg_events,xg_sum) '
+            f'SELECT matches.competition_id,matches.season_id,events.{event_column},events.type,'
+            + ','.join(f'events.{c}' for (c, t) in stats_subtypes)
+            + ',count(*),count(events._statsbomb_xg),sum(events._statsbomb_xg) '
+            f'FROM events JOIN matches ON matches.match_id = events.match_id '
+            f'WHERE events.{event_column} IS NOT NULL'
+            + (f' AND {where}' if where else '')
+            + f' GROUP BY 1,2,3,4,' + ','.join(str(i + 5) for i in range(len(stats_subtypes))))
+
+
+# -------------------------------------------------------------------------
+# to create the stats tables, existing ones are dropped
+#   conn: connection to the database
+# -------------------------------------------------------------------------
+def create_stats_tables(conn):
+    for (table_name, event_column, column) in stats_tables:
+        print(f'----- creating table {table_name}...')
+        conn.execute(f'DROP TABLE IF EXISTS {table_name}')
+        conn.execute(get_stats_ddl(table_name, column))
+        conn.execute(f'CREATE INDEX idx_{table_name}_season ON {table_name}(competition_id, season_id, type)')
+
+
+# -------------------------------------------------------------------------
+# to (re)compute the stats tables
+#   conn: connection to the database
+#   match_ids: None -> every season is recomputed
+#              list of match ids -> only the seasons of these matches are
+#              recomputed (the matches must already be in matches)
+# -------------------------------------------------------------------------
+def refresh_season_stats(conn, match_ids = None):
+    where = ''
+    params = []
+    if match_ids is not None:
+        where = ('(matches.competition_id, matches.season_id) IN '
+                 '(SELECT competition_id, season_id FROM matches WHERE match_id = ANY(%s))')
+        params = [list(match_ids)]
+
+    for (table_name, event_column, column) in stats_tables:
+        print(f'----- refreshing table {table_name}...')
+        if match_ids is None:
+            conn.execute(f'TRUNCATE {table_name}')
+        else:
+            conn.execute(f'DELETE FROM {table_name} WHERE (competition_id, season_id) IN '
+                         '(SELECT competition_id, season_id FROM matches WHERE match_id = ANY(%s))', params)
+        str = get_stats_insert(table_name, event_column, column, where)
+        print(f'      {conn.execute(str, params).rowcount} records loaded')
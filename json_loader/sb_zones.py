@@ -0,0 +1,131 @@
+'''
+----------------------------------------------------------------------------------------
+Bounding box and pitch zone filters on the events locations
+
+events has two point columns generated from its location arrays (see sb_fields):
+
+    location_point      where the event happens
+    end_location_point  where a pass, carry, shot... ends
+
+both indexed with GiST (idx_events_location, idx_events_end_location), so a filter
+such as
+
+    location_point <@ box(point(102, 18), point(120, 62))
+
+is an index scan instead of a comparison of the arrays of every row. The StatsBomb
+pitch is 120 x 80, x goes from the own goal line of the team of the event (0) to
+the goal line it attacks (120). Box boundaries are included.
+
+e.g. the shots from inside the penalty box of the La Liga 2020/2021 matches:
+
+    rows = get_zone_events(conn, 'penalty_box', 'Shot',
+                           where = "competition_name = 'La Liga' AND season_name = '2020/2021'")
+
+get_zone_filter() / get_box_filter() return the condition and its params to use
+in other queries
+----------------------------------------------------------------------------------------
+'''
+
+import traceback
+import sb_loader
+
+
+# -------------------------------------------------------------------------
+# named zones of the pitch (x0, y0, x1, y1)
+# -------------------------------------------------------------------------
+pitch_zones = {
+    'defensive_third':  (0, 0, 40, 80),
+    'middle_third':     (40, 0, 80, 80),
+    'final_third':      (80, 0, 120, 80),
+    'own_penalty_box':  (0, 18, 18, 62),
+    'own_six_yard_box': (0, 30, 6, 50),
+    'penalty_box':      (102, 18, 120, 62),
+    'six_yard_box':     (114, 30, 120, 50),
+}
+
+# point columns of events the filters apply to
+zone_columns = ['location_point', 'end_location_point']
+
+
+#-----------------------------------------------------------------------
+# To get the condition keeping the events whose <column> lies in the box
+# (x0, y0) - (x1, y1), returns (sql, params)
+#   column: location_point or end_location_point
+#   table_name: name or alias of events in the query
+#-----------------------------------------------------------------------
+def get_box_filter(x0, y0, x1, y1, column = 'location_point', table_name = 'events'):
+    if column not in zone_columns:
+        raise ValueError(f'{column} is not a point column of events, expected one of {zone_columns}')
+    return (f'{table_name}.{column} <@ box(point(%s, %s), point(%s, %s))', [x0, y0, x1, y1])
+
+
+#-----------------------------------------------------------------------
+# To get the condition keeping the events whose <column> lies in a zone
+# of pitch_zones, returns (sql, params), see get_box_filter()
+#-----------------------------------------------------------------------
+def get_zone_filter(zone, column = 'location_point', table_name = 'events'):
+    if zone not in pitch_zones:
+        raise ValueError(f'unknown pitch zone {zone}, expected one of {list(pitch_zones)}')
+    return get_box_filter(*pitch_zones[zone], column, table_name)
+
+
+#-----------------------------------------------------------------------
+# To get the events (joined with their match) whose <column> lies in a
+# zone of pitch_zones
+#   conn: connection to the database
+#   event_type: keep the events of this type only (None: every type)
+#   where, params: extra condition on events / matches and its params
+#-----------------------------------------------------------------------
+def get_zone_events(conn, zone, event_type = None, column = 'location_point', where = '', params = ()):
+    (str, zone_params) = get_zone_filter(zone, column)
+    params = zone_params + list(params)
+    if event_type is not None:
+        str += ' AND events.type = %s'
+        params.insert(len(zone_params), event_type)
+    if where:
+        str += f' AND ({where})'
+    return conn.execute('SELECT events.*, matches.competition_name, matches.season_name '
+                        'FROM events JOIN matches ON matches.match_id = events.match_id '
+                        'WHERE ' + str, params).fetchall()
+
+
+#-----------------------------------------------------------------------
+# To count the events of each competition and season whose <column>
+# lies in a zone, returns [(competition_name, season_name, count)]
+#-----------------------------------------------------------------------
+def count_zone_events(conn, zone, event_type = None, column = 'location_point'):
+    (str, params) = get_zone_filter(zone, column)
+    if event_type is not None:
+        str += ' AND events.type = %s'
+        params.append(event_type)
+    return conn.execute('SELECT matches.competition_name, matches.season_name, count(*) '
+                        'FROM events JOIN matches ON matches.match_id = events.match_id '
+                        'WHERE ' + str + ' GROUP BY 1, 2 ORDER BY 1, 2', params).fetchall()
+
+
+#-------------------------------------------
+# main
+#-------------------------------------------
+def main():
+    conn = None
+    try:
+        conn = sb_loader.connect()
+
+        print('----- shots from inside the penalty box:')
+        for (competition_name, season_name, n) in count_zone_events(conn, 'penalty_box', 'Shot'):
+            print(f'      {competition_name} {season_name}: {n}')
+
+        print('----- passes ending in the final third:')
+        for (competition_name, season_name, n) in count_zone_events(conn, 'final_third', 'Pass', 'end_location_point'):
+            print(f'      {competition_name} {season_name}: {n}')
+
+    except Exception as e:
+        print(traceback.format_exc())
+
+    finally:
+        if conn is not None:
+            conn.close()
+#-----------------------------------------------------
+
+if __name__ == '__main__':
+    main()